@@ -2,7 +2,6 @@ from __future__ import print_function
 import numpy as np
 from collections import Counter
 import itertools
-from tqdm import tqdm
 
 
 class agent(object):
@@ -14,7 +13,7 @@ class agent(object):
         node_number: int, assigning variable name to agents. Just use index position
         G: A networkx graph structure; G(V,E)
         env: an environment. Environment and Agents will communicate and pass back and forth state information
-        seed: int, used for random number generator
+        seed: unused. Randomness comes from env.rng, seeded once per environment
 
                                 env(G(V,E), Agents(G(V,E), env))
                                 agents operate within the environment class.
@@ -24,48 +23,70 @@ class agent(object):
     '''
 
     #-----------------------------------------------------------------------------------------------#
-    def __init__(self, node_number, G, env, seed=1, enable_print=1):
+    def __init__(self, node_number, G, env, seed=None, enable_print=1):
         self.node_number = node_number
         self.nodeData = env.nodeData                                 #key (node number): (strategy, p_act, neighbors, degree)
-        self.seed = np.random.seed(seed)
+        self.seed = seed
         self.letters = {
             'letters_initial': [],
             'letters_stolen': [],
             'letters_received': []
         }
         self.target_word = []
-        self.l_union_vi = []
-        self.letters_needed = []
+        self.target_index = -1  #index of target_word in env.cand_index
+        self.counts = env.hand_counts[node_number]  #live letter counts of l_union_vi, a row of env.hand_counts
+        self.target_counts = np.zeros_like(self.counts)
+        self.needed_counts = np.zeros_like(self.counts)  #copies of each letter still missing from the target
+        self.alphabet = env.alphabet
         self.corpus = []
         self.actions_taken = 0
         self.words_formed = 0
 
-    def _merge_letters(self):
+    @property
+    def l_union_vi(self):
         #-----------------------------------------------------------------------------------------------#
         '''
         Merge all letters in agent.letters
         This returns a set of all letters, including non-unique entries
         '''
         #-----------------------------------------------------------------------------------------------#
-        self.l_union_vi = list(itertools.chain.from_iterable(self.letters.values()))
+        return list(itertools.chain.from_iterable(self.letters.values()))
+
+    @property
+    def letters_needed(self):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Letters needed to complete the target word, one entry per missing copy, read off needed_counts.
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        return np.repeat(self.alphabet, self.needed_counts)
 
     def _find_needed_letters(self):
         #-----------------------------------------------------------------------------------------------#
         '''
-        Find the letters needed to complete a target word. Calc difference between two independent sets.
+        Find the letters needed to complete a target word: multiset difference of the target word and the
+        hand, so a target with a repeated letter needs every copy. Only needed when the target changes;
+        gaining a letter updates needed_counts in place (_gain_letter).
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        np.maximum(self.target_counts - self.counts, 0, out=self.needed_counts)
+
+    def _gain_letter(self, env, letter, slot):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Add one letter (alphabet index) to agent.letters[slot] and update the counts in O(1).
         '''
         #-----------------------------------------------------------------------------------------------#
-        self._merge_letters()
-        self.letters_needed = np.setdiff1d(self.target_word, self.l_union_vi)
+        self.letters[slot].append(self.alphabet[letter])
+        self.counts[letter] += 1
+        if self.needed_counts[letter] > 0:
+            self.needed_counts[letter] -= 1
 
     def _update_state_info(self,env):
-        self._merge_letters() #Remerge and update lunion
-        self._find_needed_letters() #re-find needed letters
-        env.historical_states[env.time] = env.current_state
         env.current_state[self.node_number] = self.letters
         env.time += 1
+        env.historical_states.maybe_keyframe(env.time, env.state_counts)
         self.actions_taken += 1
-        print('state info updated')
 
     def get_init_hand(self, env):
         #-----------------------------------------------------------------------------------------------#
@@ -75,9 +96,12 @@ class agent(object):
         Assign back to dict in environment containing local state information.
         '''
         #-----------------------------------------------------------------------------------------------#
-        self.letters['letters_initial'] = np.random.choice(
-            env.alphabet, 5)  #k is the length of each element in corpus
+        self.letters['letters_initial'] = env.rng.choice(
+            env.alphabet, env.hand_size)  #env.hand_size letters, 5 by default
         env.current_state[self.node_number] = self.letters
+        codes = [env.corpus_index.lookup[l] for l in self.letters['letters_initial']]
+        np.add.at(self.counts, codes, 1)
+        env.historical_states.record_batch(env.time, self.node_number, 0, codes)
 
     def get_target_word(self, env):
         #-----------------------------------------------------------------------------------------------#
@@ -86,14 +110,23 @@ class agent(object):
         to determine a target word that is the closest to us.
         '''
         #-----------------------------------------------------------------------------------------------#
-        matches = []
-        for i in self.corpus:
-            matches.append(
-                len(self.l_union_vi) -
-                len([j for j in self.l_union_vi if j in i]))
-        tword = self.corpus[np.argmin(matches)]
-        self.corpus.remove(tword)
-        self.target_word = [i for i in tword]
+        if env.target_cache is not None:
+            tword = env.target_cache.best(self.counts, env.corpus_available)  #same pick, memoized per hand
+        elif env.corpus_available.any():
+            scores = self.corpus.score(self.counts)
+            scores[~env.corpus_available] = -1  #claimed words can never win
+            tword = np.argmax(scores)  #first best match, as np.argmin over distances
+        else:
+            tword = -1
+        if tword < 0:
+            self.target_word = []  #C^possible exhausted
+            self.target_index = -1
+            self.target_counts[:] = 0
+        else:
+            env.corpus_available[tword] = False
+            self.target_index = tword
+            self.target_counts[:] = self.corpus.counts[tword]
+            self.target_word = [i for i in self.corpus.words[tword]]
         self._find_needed_letters()
 
     def _agent_form_word(self,env):
@@ -102,63 +135,51 @@ class agent(object):
         Need to update to remove letters from Lrecieved and Lstolen if used to form a word
         '''
         #-----------------------------------------------------------------------------------------------#
-        print('-' * 50)
         assert env.time < env.time_max, 'Maximum time allowed has been reached'
-        print('action to node: {}'.format(self.node_number))
-        print('Move Number: {} , Env Clock: {}'.format(self.actions_taken, env.time))
-
-        print('taking action: Form Word')
-        if len(self.letters_needed) == 0:
+        formed = -1
+        if len(self.target_word) != 0 and not self.needed_counts.any():
+            formed = self.target_index
             env.words_formed.append(("".join(self.target_word),self.node_number)) #global counter
+            self.words_formed += 1
             self.get_target_word(env) #get new target word
-        else:
-            print('unable to form word. Need additional letters.')
+        if env.log.enabled:
+            env.log.event(env.time, self.node_number, 0, -1, formed, formed >= 0)
         self._update_state_info(env)
-        print('-' * 50)
-
-
+        return formed >= 0
 
     def _agent_steal_letter(self,env):
         #-----------------------------------------------------------------------------------------------#
         '''
         Find letters needed to complete the target word.
-        Randomly selects a single letter.
-        Finds neighbors of current node and scans their union set to see if this letter exists. If it does, steals letter.
-        Update env.current state and pop current state to historical state. Increment timer
+        Randomly selects a single letter (with env.lookahead, the held one completing the most words).
+        Looks the letter up in env.hand_counts for the neighbors of the current node. If one holds it, steals letter.
+        Update env.current state and log the change to env.historical_states. Increment timer
         Need to update so a letter stolen from non init dist is depleted
         '''
         #-----------------------------------------------------------------------------------------------#
-        print('-' * 50)
         assert env.time < env.time_max, 'Maximum time allowed has been reached'
-        print('action to node: {}'.format(self.node_number))
-        print('Move Number: {} , Env Clock: {}'.format(self.actions_taken, env.time))
-
-        print('taking action: steal letter')
-        neighbors = self.nodeData[self.node_number][2]
-        print('available neighbors: {}'.format(neighbors))
-        letters_needed = self.letters_needed
-        print(f'letters needed to reach the target {letters_needed}')
-        if len(letters_needed) != 0:
-            choose_letter_to_steal = np.random.choice(letters_needed)
-        else: choose_letter_to_steal = None
-
-        if choose_letter_to_steal != None:
-            print(f'randomly selecting letter to steal: {choose_letter_to_steal}')
-            for k, v in env.agents.items():
-                if k in neighbors:
-                    if choose_letter_to_steal in v.l_union_vi:
-                        print(
-                            f'neighbor {env.agents[k].node_number} : neighbor hand {env.agents[k].l_union_vi}'
-                        )
-                        self.letters['letters_stolen'].append(
-                            choose_letter_to_steal)  #update local state
-                        print('letter successfully stolen from node {}'.format(k))
-                        break
-        else:
-            print('unable to steal the chosen letter from k-hop neighbors')
+        letter, donor = -1, -1
+        if env.lookahead_index is not None:
+            letter, donor = self._lookahead_steal(env)
+        if donor < 0:
+            letters_needed = self.letters_needed
+            if len(letters_needed) != 0:
+                choose_letter_to_steal = env.rng.choice(letters_needed)
+            else: choose_letter_to_steal = None
 
+            if choose_letter_to_steal != None:
+                letter = env.corpus_index.lookup[choose_letter_to_steal]
+                neighbors = env.neighbors(self.node_number)
+                holders = neighbors[env.hand_counts[neighbors, letter] > 0]
+                if len(holders):
+                    donor = int(holders[0])
+        if donor >= 0:
+            self._gain_letter(env, letter, 'letters_stolen')  #update local state
+            env.historical_states.record(env.time, self.node_number, 1, letter)
+        if env.log.enabled:
+            env.log.event(env.time, self.node_number, 1, letter, donor, donor >= 0)
         self._update_state_info(env)
-        print('-' * 50)
+        return donor >= 0
 
     def _agent_pass_letter(self,env):
         #-----------------------------------------------------------------------------------------------#
@@ -166,63 +187,105 @@ class agent(object):
         Need to update so a letter passed from non init dist is depleted
         '''
         #-----------------------------------------------------------------------------------------------#
-        print('-' * 50)
         assert env.time < env.time_max, 'Maximum time allowed has been reached'
-        print('action to node: {}'.format(self.node_number))
-        print('Move Number: {} , Env Clock: {}'.format(self.actions_taken, env.time))
-        print('taking action: pass letter')
-        neighbors = self.nodeData[self.node_number][2]
-        print('available neighbors: {}'.format(neighbors))
-        choose_letter_to_pass = np.random.choice(self.letters['letters_initial'])
-        if choose_letter_to_pass != None:
-            print(f'randomly selecting letter to pass: {choose_letter_to_pass}')
-            for k, v in env.agents.items():
-                if k in neighbors:
-                    if choose_letter_to_pass not in v.l_union_vi:
-                        print(
-                            f'neighbor {env.agents[k].node_number} : neighbor hand {env.agents[k].l_union_vi}'
-                        )
-                        env.agents[k].letters['letters_received'].append(
-                            choose_letter_to_pass)  #update local state
-                        print('letter successfully passed from node {} to node {}'.format(self.node_number, k))
-                        break
-        else:
-            print('unable to steal the chosen letter from k-hop neighbors')
-
+        letter, receiver = -1, -1
+        if env.lookahead_index is not None:
+            letter, receiver = self._lookahead_pass(env)
+        if receiver < 0:
+            choose_letter_to_pass = env.rng.choice(self.letters['letters_initial'])
+            letter = env.corpus_index.lookup[choose_letter_to_pass]
+            neighbors = env.neighbors(self.node_number)
+            lacking = neighbors[env.hand_counts[neighbors, letter] == 0]
+            if len(lacking):
+                receiver = int(lacking[0])
+        if receiver >= 0:
+            env.agents[receiver]._gain_letter(env, letter, 'letters_received')  #update local state
+            env.historical_states.record(env.time, receiver, 2, letter)
+        if env.log.enabled:
+            env.log.event(env.time, self.node_number, 2, letter, receiver, receiver >= 0)
         self._update_state_info(env)
-        print('-' * 50)
+        return receiver >= 0
+
+    def _lookahead_steal(self, env):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Among the needed letters some neighbor holds, pick the one that also completes the most other
+        available words (env.lookahead_index), and its first holder. (-1, -1) if no neighbor holds any
+        or none completes anything, so the random choice decides.
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        needed = np.flatnonzero(self.needed_counts)
+        neighbors = env.neighbors(self.node_number)
+        if len(needed) == 0 or len(neighbors) == 0:
+            return -1, -1
+        held = env.hand_counts[neighbors][:, needed] > 0
+        letters = needed[held.any(axis=0)]
+        if len(letters) == 0:
+            return -1, -1
+        gains = env.lookahead_index.unlocks(self.counts, letters, env.corpus_available)
+        if gains.max() == 0:
+            return -1, -1
+        k = int(np.argmax(gains))
+        holders = neighbors[env.hand_counts[neighbors, letters[k]] > 0]
+        return int(letters[k]), int(holders[0])
+
+    def _lookahead_pass(self, env):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Pick the (letter of letters_initial, neighbor lacking it) pair that completes the most available
+        words for the receiver (env.lookahead_index). (-1, -1) if no pass completes anything.
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        letters = np.unique([env.corpus_index.lookup[l] for l in self.letters['letters_initial']])
+        neighbors = env.neighbors(self.node_number)
+        if len(letters) == 0 or len(neighbors) == 0:
+            return -1, -1
+        hands = env.hand_counts[neighbors]
+        gains = env.lookahead_index.unlocks_many(hands, env.corpus_available)[:, letters]
+        gains[hands[:, letters] > 0] = 0  #only letters the receiver lacks
+        k = int(np.argmax(gains))  #first neighbor with the most, then its first letter
+        if gains.flat[k] == 0:
+            return -1, -1
+        i, j = divmod(k, len(letters))
+        return int(letters[j]), int(neighbors[i])
 
     def _agent_think(self,env):
         #-----------------------------------------------------------------------------------------------#
         '''
         '''
         #-----------------------------------------------------------------------------------------------#
-        print('-' * 50)
         assert env.time < env.time_max, 'Maximum time allowed has been reached'
-        print('action to node: {}'.format(self.node_number))
-        print('Move Number: {} , Env Clock: {}'.format(self.actions_taken, env.time))
-
-        print('taking action: think')
+        if env.log.enabled:
+            env.log.event(env.time, self.node_number, 3)
         self._update_state_info(env)
-        print('-' * 50)
+        return True
 
-    def take_action(self,env):
+    def take_action(self, env, action=None):
         #-----------------------------------------------------------------------------------------------#
         '''
+        PARMS:
+            env: the environment
+            action: int, index into env.action_space. Normally pre-drawn in blocks by env.play;
+                    sampled from this agent's p_act with env.rng if not given.
+        RETURNS:
+            bool, whether the action succeeded
         '''
         #-----------------------------------------------------------------------------------------------#
-        n_Data = self.nodeData[self.node_number]
-        # node = self.node_number
-        # strategy = n_Data[0]
-        p_act = n_Data[1]
-        # neighbors = n_Data[2]
-        action_sampling = np.random.choice(env.action_space, p=p_act)
+        if action is None:
+            action = env.sample_action(self.node_number)
+        profiler = env.profiler
+        if profiler is not None:
+            start = profiler.clock()
+
+        if action == 0:  #form_word
+            ok = self._agent_form_word(env)
+        elif action == 1:  #steal_letter
+            ok = self._agent_steal_letter(env)
+        elif action == 2:  #pass_letter
+            ok = self._agent_pass_letter(env)
+        elif action == 3:  #think / null action
+            ok = self._agent_think(env)
 
-        if action_sampling == env.action_space[0]:  #form_word
-            self._agent_form_word(env)
-        if action_sampling == env.action_space[1]:  #steal_letter
-            self._agent_steal_letter(env)
-        if action_sampling == env.action_space[2]:  #pass_letter
-            self._agent_pass_letter(env)
-        if action_sampling == env.action_space[3]:  #think / null action
-            self._agent_think(env)
+        if profiler is not None:
+            profiler.record(action, profiler.clock() - start, 1, int(ok))
+        return ok
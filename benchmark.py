@@ -0,0 +1,274 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from utils.graphinit import Network
+from utils.helpers import possible_words
+from env import environment
+from headless import import_time
+
+#-----------------------------------------------------------------------------------------------#
+'''
+Offline benchmark harness. Times the hot paths of a game on fixed-seed scenarios and writes the
+results as JSON, so engines can be compared and slowdowns caught before they reach a sweep.
+
+Benchmarks:
+    make_random_graph   graph generation + node / edge attributes       (step = one node)
+    possible_words      filtering a corpus against a pooled hand         (step = one corpus word)
+    get_target_word     target search against C^possible, object engine  (step = one agent), once
+                        without the RankCache (target_cache=0) and once with the default cache
+    take_action         one action of one agent, per action type         (step = one action)
+    play                environment.play for every engine                (step = one clock tick)
+    import headless     import time of the headless entry point in a fresh interpreter
+
+Every result row holds steps, seconds, step_us (latency per step), steps_per_s and peak_mb (peak
+memory allocated while the benchmark ran, from tracemalloc). The process max RSS is added to the
+metadata. Graphs have a mean degree of about 4 at every size.
+
+EXAMPLE:
+    python benchmark.py --sizes 10 1000 --out bench.json
+    python benchmark.py --sizes 10 1000 100000 --engines array partitioned --out bench.json
+    python benchmark.py --compare bench_before.json --out bench_after.json
+'''
+#-----------------------------------------------------------------------------------------------#
+
+SIZES = [10, 1000, 100000]
+CORPUS_SIZES = [500, 5757, 57570]  #words; past the word list it is repeated
+ENGINES = ['object', 'array', 'partitioned']
+TARGET_CACHE = 4096  #environment's default RankCache size
+ACTIONS = ['form_word', 'steal_letter', 'pass_letter', 'think']
+
+
+def measure(fn, steps, repeat=1):
+    #-----------------------------------------------------------------------------------------------#
+    '''
+    PARMS:
+        fn: callable, run repeat + 1 times. Returns nothing, or the number of steps it actually took.
+        steps: int, steps one call of fn stands for
+        repeat: int, timed calls. Latency is the fastest of them. A first, untimed call runs under
+                tracemalloc for the memory peak (tracing slows allocations down) and warms caches up.
+    RETURNS:
+        dict, steps / seconds / step_us / steps_per_s / peak_mb
+    '''
+    #-----------------------------------------------------------------------------------------------#
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    best = None
+    for _ in range(max(repeat, 1)):
+        start = time.perf_counter()
+        done = fn()
+        seconds = time.perf_counter() - start
+        n = steps if done is None else done
+        if best is None or seconds / max(n, 1) < best[1] / max(best[0], 1):
+            best = (n, seconds)
+    n, seconds = best
+    return {'steps': n, 'seconds': seconds, 'step_us': 1e6 * seconds / max(n, 1),
+            'steps_per_s': n / seconds if seconds > 0 else float('inf'), 'peak_mb': peak / 2**20}
+
+
+def make_graph(n, seed):
+    #-----------------------------------------------------------------------------------------------#
+    '''
+    Connected gnp graph of mean degree ~4 (a stitched sparse graph past a few hundred nodes).
+    '''
+    #-----------------------------------------------------------------------------------------------#
+    connect = 'resample' if n <= 100 else 'stitch'
+    network = Network(n, min(4. / max(n - 1, 1), 0.5), 0.5, 0.2, seed=seed, connect=connect)
+    return network.make_random_graph(plot=False, print_table=False)[0]
+
+
+def make_env(G, engine, seed, t_max=0, **options):
+    env = environment(G, t_max=t_max, engine=engine, seed=seed, **options)
+    env.set_env()
+    return env
+
+
+def bench_graph(n, seed, repeat):
+    def run():
+        make_graph(n, seed)
+    return measure(run, n, repeat)
+
+
+def bench_possible_words(n_words, seed, repeat):
+    words = [w.strip() for w in open('txt/five_letter_words.txt') if w.strip()]
+    words = (words * (n_words // len(words) + 1))[:n_words]
+    rng = np.random.default_rng(seed)
+    pool = list(rng.choice(list('abcdefghijklmnopqrstuvwxyz'), 20))
+
+    def run():
+        possible_words(words, pool)
+    return measure(run, n_words, repeat)
+
+
+def bench_target_word(G, seed, repeat, target_cache=0):
+    #-----------------------------------------------------------------------------------------------#
+    '''
+    Every agent searches its target once per call. target_cache: RankCache size, 0 for the plain scan.
+    With a cache, measure's untimed first call fills it, so the timed calls are the repeat-hand hits.
+    '''
+    #-----------------------------------------------------------------------------------------------#
+    env = make_env(G, 'object', seed, target_cache=target_cache)
+    agents = list(env.agents.values())
+
+    def run():
+        env.corpus_available[:] = True
+        for a in agents:
+            a.get_target_word(env)
+    return measure(run, len(agents), repeat)
+
+
+def bench_take_action(G, seed, repeat, n_calls=2000):
+    #-----------------------------------------------------------------------------------------------#
+    '''
+    One row per action type: n_calls actions spread round robin over the agents of a fresh game.
+    '''
+    #-----------------------------------------------------------------------------------------------#
+    rows = {}
+    for action, name in enumerate(ACTIONS):
+        env = make_env(G, 'object', seed, t_max=2**62)
+        agents = [env.agents[i] for i in range(len(env.agents))]
+        order = [agents[k % len(agents)] for k in range(n_calls)]
+
+        def run():
+            for a in order:
+                a.take_action(env, action)
+        rows[name] = measure(run, n_calls, repeat)
+    return rows
+
+
+def bench_play(G, engine, seed, repeat, ticks):
+    #-----------------------------------------------------------------------------------------------#
+    '''
+    Time environment.play for ticks clock ticks after set_env (set_env is timed separately).
+    '''
+    #-----------------------------------------------------------------------------------------------#
+    envs = []
+
+    def setup():
+        envs.append(make_env(G, engine, seed))
+    setup = measure(setup, G.number_of_nodes(), repeat)
+
+    def run():
+        env = envs.pop()
+        env.time_max = env.time + ticks
+        start = env.time
+        env.play()
+        return env.time - start
+    return setup, measure(run, ticks, repeat)
+
+
+def run_benchmarks(sizes=SIZES, corpus_sizes=CORPUS_SIZES, engines=ENGINES, seed=0, repeat=3,
+                   ticks_per_node=20, max_ticks=200000, verbose=True):
+    #-----------------------------------------------------------------------------------------------#
+    '''
+    PARMS:
+        sizes: list of int, graph sizes (nodes)
+        corpus_sizes: list of int, corpus sizes for possible_words
+        engines: list of str, engines timed by the play benchmark
+        seed: int, seeds the graphs and the games, so every run times the same work
+        repeat: int, timed calls per benchmark, see measure. Graphs past 1000 nodes are timed once
+        ticks_per_node, max_ticks: play runs min(ticks_per_node * nodes, max_ticks) ticks
+    RETURNS:
+        dict, {'meta': {...}, 'results': [row, ...]}, every row tagged with bench / nodes / words /
+        engine / action / target_cache where they apply
+    '''
+    #-----------------------------------------------------------------------------------------------#
+    results = []
+
+    def add(row, **tags):
+        row = dict(tags, **row)
+        results.append(row)
+        if verbose:
+            label = ' '.join('{}={}'.format(k, v) for k, v in tags.items())
+            print('{:<55} {:>12.2f} us/step {:>14.0f} steps/s {:>9.1f} MB'.format(
+                label, row['step_us'], row['steps_per_s'], row['peak_mb']))
+
+    imported = import_time()  #peak memory is not measured in the child interpreter
+    s = imported['seconds']
+    add({'steps': 1, 'seconds': s, 'step_us': 1e6 * s, 'steps_per_s': 1 / s, 'peak_mb': float('nan'),
+         'matplotlib': imported['matplotlib'], 'pandas': imported['pandas']},
+        bench='import', module=imported['module'])
+
+    for n_words in corpus_sizes:
+        add(bench_possible_words(n_words, seed, repeat), bench='possible_words', words=n_words)
+
+    for n in sizes:
+        r = repeat if n <= 1000 else 1
+        add(bench_graph(n, seed, r), bench='make_random_graph', nodes=n)
+        G = make_graph(n, seed)
+        if 'object' in engines:
+            for cache in (0, TARGET_CACHE):
+                add(bench_target_word(G, seed, r, cache), bench='get_target_word', nodes=n,
+                    target_cache=cache)
+            for name, row in bench_take_action(G, seed, r).items():
+                add(row, bench='take_action', nodes=n, action=name)
+        ticks = min(ticks_per_node * n, max_ticks)
+        for engine in engines:
+            setup, row = bench_play(G, engine, seed, r, ticks)
+            add(setup, bench='set_env', nodes=n, engine=engine)
+            add(row, bench='play', nodes=n, engine=engine)
+
+    meta = {
+        'python': platform.python_version(), 'numpy': np.__version__,
+        'platform': platform.platform(), 'cpu_count': os.cpu_count(), 'seed': seed,
+        'repeat': repeat, 'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.,
+    }
+    return {'meta': meta, 'results': results}
+
+
+def compare(before, after, threshold=0.2):
+    #-----------------------------------------------------------------------------------------------#
+    '''
+    Match the rows of two result sets on their tags and list those whose step latency grew by more
+    than threshold (0.2 = 20% slower).
+    '''
+    #-----------------------------------------------------------------------------------------------#
+    def key(row):
+        return tuple((k, row.get(k)) for k in ('bench', 'nodes', 'words', 'engine', 'action', 'target_cache'))
+
+    old = {key(r): r for r in before['results']}
+    slower = []
+    for row in after['results']:
+        prev = old.get(key(row))
+        if prev is not None and row['step_us'] > (1 + threshold) * prev['step_us']:
+            slower.append((dict(key(row)), prev['step_us'], row['step_us']))
+    return slower
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the simulation hot paths')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--corpus-sizes', type=int, nargs='+', default=CORPUS_SIZES)
+    parser.add_argument('--engines', nargs='+', default=ENGINES)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--ticks-per-node', type=int, default=20)
+    parser.add_argument('--max-ticks', type=int, default=200000)
+    parser.add_argument('--out', default='benchmark.json')
+    parser.add_argument('--compare', default=None, help='earlier results file to check for slowdowns')
+    parser.add_argument('--threshold', type=float, default=0.2)
+    args = parser.parse_args()
+
+    out = run_benchmarks(args.sizes, args.corpus_sizes, args.engines, args.seed, args.repeat,
+                         args.ticks_per_node, args.max_ticks)
+    with open(args.out, 'w') as f:
+        json.dump(out, f, indent=1)
+    print('results written to {}'.format(os.path.abspath(args.out)))
+
+    if args.compare:
+        with open(args.compare) as f:
+            slower = compare(json.load(f), out, args.threshold)
+        for tags, before, after in slower:
+            print('SLOWER {}: {:.2f} -> {:.2f} us/step'.format(tags, before, after))
+        sys.exit(1 if slower else 0)
@@ -0,0 +1,104 @@
+import argparse
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+from utils.events import read_columns
+from utils.graphinit import Network
+from env import environment
+
+#-----------------------------------------------------------------------------------------------#
+'''
+Checkpoint round-trip check. Plays small fixed-seed games with and without a save_checkpoint /
+load_checkpoint in the middle and reports any difference in the words formed, the state history or
+the event log. Every file it writes goes to a temporary directory that is removed afterwards.
+
+EXAMPLE:
+    python check_checkpoint.py                  #exits non-zero on a mismatch
+
+    from check_checkpoint import check_checkpoint
+    check_checkpoint('array', log='npz')        #[] when the resumed game is identical
+'''
+#-----------------------------------------------------------------------------------------------#
+
+CASES = [('object', {}), ('array', {}), ('object', {'lookahead': True}),
+         ('object', {'log': 'binary'}), ('array', {'log': 'jsonl'}), ('array', {'log': 'npz'})]
+
+
+def check_checkpoint(engine='object', n=30, rounds=60, seed=0, log='off', **options):
+    #-----------------------------------------------------------------------------------------------#
+    '''
+    Self-check of save_checkpoint / load_checkpoint: play a game halfway, checkpoint it at a round
+    boundary, resume it and play it out, then compare with the same game played without interruption.
+
+    PARMS:
+        engine: str, 'object' or 'array' (the engines that resume bit-exactly)
+        n: int, graph size
+        rounds: int, game length in rounds; the checkpoint is taken after rounds // 2
+        log: str, log mode. Other than 'off', the interrupted game keeps logging a few rounds past the
+             checkpoint before it is resumed into the same log_path, whose events must then match the
+             log of the uninterrupted game.
+        options: further environment options, e.g. lookahead=True
+    RETURNS:
+        list of str, the mismatches found. Empty if the resumed game is identical.
+    '''
+    #-----------------------------------------------------------------------------------------------#
+    network = Network(n, min(4. / max(n - 1, 1), 0.5), 0.5, 0.2, seed=seed, connect='resample')
+    G = network.make_random_graph(plot=False, print_table=False)[0]
+    t_max = 1 + rounds * n  #set_env takes tick 0, rounds start at 1 + k * n
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'checkpoint.npz')
+        full_log, half_log = (os.path.join(tmp, name) for name in ('full.log', 'half.log'))
+        full = environment(G, t_max, engine=engine, seed=seed, log=log, log_path=full_log, **options)
+        full.set_env()
+        full.play()
+        full.log.close()
+
+        half = environment(G, 1 + rounds // 2 * n, engine=engine, seed=seed, log=log, log_path=half_log,
+                           **options)
+        half.set_env()
+        half.play()
+        half.save_checkpoint(path)
+        half.time_max += 3 * n  #events logged after the checkpoint, lost with the process
+        half.play()
+        half.log.close()
+
+        resumed = environment.load_checkpoint(path, log=log, log_path=half_log)
+        resumed.time_max = t_max
+        resumed.play()
+        resumed.log.close()
+
+        failed = []
+        if resumed.words_formed != full.words_formed:
+            failed.append('words_formed: {} resumed, {} uninterrupted'.format(
+                len(resumed.words_formed), len(full.words_formed)))
+        for t in np.linspace(0, t_max - 1, 9).astype(int):
+            if not np.array_equal(resumed.historical_states.state_at(t), full.historical_states.state_at(t)):
+                failed.append('state_at({}) differs'.format(t))
+        if log != 'off' and _log_events(log, half_log) != _log_events(log, full_log):
+            failed.append('{} log of the resumed game differs'.format(log))
+    return failed
+
+
+def _log_events(log, path):
+    if log in ('npz', 'parquet'):
+        columns = read_columns(path)
+        return {k: v.tolist() for k, v in columns.items()}
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check that resumed games match uninterrupted ones')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    failed = False
+    for engine, options in CASES:
+        problems = check_checkpoint(engine, seed=args.seed, **options)
+        label = ' '.join([engine] + ['{}={}'.format(k, v) for k, v in options.items()])
+        print('checkpoint {:<25} {}'.format(label, '; '.join(problems) or 'ok'))
+        failed = failed or bool(problems)
+    sys.exit(1 if failed else 0)
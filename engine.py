@@ -0,0 +1,448 @@
+from __future__ import print_function
+import numpy as np
+from utils.helpers import csr_gather
+
+
+def first_in_segment(seg, hit, n_segments):
+    #-----------------------------------------------------------------------------------------------#
+    '''
+    For a flattened list of segments (see utils.helpers.csr_gather), return per segment the position
+    of its first True entry in hit, or -1 if the segment has none.
+    '''
+    #-----------------------------------------------------------------------------------------------#
+    pos = np.flatnonzero(hit)
+    first = np.full(n_segments, -1, dtype=np.int64)
+    segs, idx = np.unique(seg[pos], return_index=True)
+    first[segs] = pos[idx]
+    return first
+
+
+class array_engine(object):
+    #-----------------------------------------------------------------------------------------------#
+    '''
+    Structure-of-arrays simulation engine. Holds the state of the whole population in dense arrays
+    instead of one agent object per node, so a round of action sampling and letter bookkeeping is a
+    handful of batched array operations.
+
+    PARMS:
+        env: an environment created with engine='array'. The engine reads the graph, corpus index
+             and clock from env and writes words_formed / time back to it.
+        hand_size: int, number of letters dealt to every agent at t=0
+
+    STATE:
+        hand_initial: (agents, hand_size) letter indices, the agents' letters_initial
+        initial, stolen, received: (agents, letters) letter counts, one per agent.letters list
+        target: (agents,) index of the target word in env.cand_index, -1 if none
+        target_counts: (agents, letters) letter counts of the target word
+        p_cum: (agents, actions) cumulative p_act rows used for inverse-CDF action sampling
+
+    A round is synchronous: every acting agent decides from the state at the start of the round and
+    all steals / passes land together at the end of it. Otherwise the rules follow agent.take_action.
+    '''
+    #-----------------------------------------------------------------------------------------------#
+    def __init__(self, env, hand_size=5):
+        self.env = env
+        G = env.G
+        self.n_agents = G.number_of_nodes()
+        self.n_letters = len(env.alphabet)
+        self.hand_size = hand_size
+        self.indptr, self.indices = env.indptr, env.indices
+
+        self.strategy = np.array([G.nodes[i]['atts'][0] for i in range(self.n_agents)])
+        self._allocate()
+
+    def _allocate(self):
+        shape = (self.n_agents, self.n_letters)
+        self.hand_initial = np.zeros((self.n_agents, self.hand_size), dtype=np.int64)
+        self.initial = np.zeros(shape, dtype=np.int32)
+        self.stolen = np.zeros(shape, dtype=np.int32)
+        self.received = np.zeros(shape, dtype=np.int32)
+        self.target = np.full(self.n_agents, -1, dtype=np.int64)
+        self.target_counts = np.zeros(shape, dtype=np.int32)
+        self.actions_taken = np.zeros(self.n_agents, dtype=np.int64)
+        self.words_formed = np.zeros(self.n_agents, dtype=np.int64)
+
+    def union(self):
+        return self.initial + self.stolen + self.received
+
+    def union_rows(self, rows):
+        return self.initial[rows] + self.stolen[rows] + self.received[rows]
+
+    def needed(self, rows, union):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        (len(rows), letters) copies of each letter of the target word missing from the hand
+        (agent.needed_counts)
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        return np.maximum(self.target_counts[rows] - union[rows], 0)
+
+    def deal(self):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Deal letters_initial to every agent, uniformly over the alphabet (agent.get_init_hand).
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        self.hand_initial = self.env.rng.integers(0, self.n_letters, size=(self.n_agents, self.hand_size))
+        rows = np.repeat(np.arange(self.n_agents), self.hand_size)
+        self.initial[:] = np.bincount(rows * self.n_letters + self.hand_initial.ravel(),
+                                      minlength=self.n_agents * self.n_letters).reshape(self.initial.shape)
+        self.env.historical_states.record_batch(self.env.time, rows, 0, self.hand_initial.ravel())
+
+    def retarget(self, rows, hands, chunk=4096):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Give each agent in rows (in order) the closest still available word to its hand, claiming it
+        in env.corpus_available as agent.get_target_word does.
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        cand = self.env.cand_index
+        avail = self.env.corpus_available
+        cache = self.env.target_cache
+        if cache is not None:
+            for lo in range(0, len(rows), chunk):
+                if not avail.any():
+                    self.target[rows[lo:]] = -1  #C^possible exhausted
+                    break
+                part = hands[lo:lo + chunk]
+                cold = np.flatnonzero([not cache.cached(h) for h in part])
+                scores = cand.score(part[cold])  #misses scored in one batch
+                slot = np.full(len(part), -1)
+                slot[cold] = np.arange(len(cold))
+                for k, i in enumerate(rows[lo:lo + chunk]):
+                    w = cache.best(part[k], avail, scores[slot[k]] if slot[k] >= 0 else None)
+                    if w >= 0:
+                        avail[w] = False
+                    self.target[i] = w
+        elif not hands.any():
+            #every word scores zero, so agents simply take the available words in order
+            free = np.flatnonzero(avail)[:len(rows)]
+            self.target[rows] = -1
+            self.target[rows[:len(free)]] = free
+            avail[free] = False
+        else:
+            for lo in range(0, len(rows), chunk):
+                scores = cand.score(hands[lo:lo + chunk])
+                for k, i in enumerate(rows[lo:lo + chunk]):
+                    if not avail.any():
+                        self.target[i] = -1
+                        continue
+                    w = np.argmax(np.where(avail, scores[k], -1))
+                    avail[w] = False
+                    self.target[i] = w
+
+        has_target = self.target[rows] >= 0
+        self.target_counts[rows] = 0
+        self.target_counts[rows[has_target]] = cand.counts[self.target[rows[has_target]]]
+
+    def set_agents(self):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Array counterpart of environment.set_agents: deal hands, find C^possible, set initial targets.
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        env = self.env
+        with env._phase('deal'):
+            self.deal()
+        with env._phase('_find_cand_words'):
+            env._find_cand_words()
+        with env._phase('_set_init_targets'):
+            self.retarget(np.arange(self.n_agents), self.initial)
+            env._push_to_historical()
+        env.time += 1
+
+    def _steal(self, rows, union):
+        needed = self.needed(rows, union)
+        n_needed = needed.sum(axis=1)
+        rows, needed, n_needed = rows[n_needed > 0], needed[n_needed > 0], n_needed[n_needed > 0]
+
+        #pick one needed letter per stealer, uniformly over the missing copies (agent.letters_needed)
+        k = np.floor(self.env.rng.random(len(rows)) * n_needed)
+        letter = (np.cumsum(needed, axis=1) > k[:, None]).argmax(axis=1)
+
+        seg, nbrs = csr_gather(self.indptr, self.indices, rows)
+        first = first_in_segment(seg, union[nbrs, letter[seg]] > 0, len(rows))
+        ok = first >= 0
+        donor = np.full(len(rows), -1, dtype=np.int64)
+        donor[ok] = nbrs[first[ok]]
+        return rows, letter, donor
+
+    def _pass(self, rows, union):
+        pick = self.env.rng.integers(0, self.hand_size, size=len(rows))
+        letter = self.hand_initial[rows, pick]
+
+        seg, nbrs = csr_gather(self.indptr, self.indices, rows)
+        first = first_in_segment(seg, union[nbrs, letter[seg]] == 0, len(rows))
+        ok = first >= 0
+        receiver = np.full(len(rows), -1, dtype=np.int64)
+        receiver[ok] = nbrs[first[ok]]
+        return rows, letter, receiver
+
+    def _form(self, rows, union):
+        needed = self.needed(rows, union)
+        ok = (self.target[rows] >= 0) & ~needed.any(axis=1)
+        return rows, np.where(ok, self.target[rows], -1)
+
+    def decide(self, rows, act, union):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Resolve the actions act of the agents in rows against the hands in union (the state at the start
+        of the round). Changes nothing. Returns the round's decisions:
+            (formers, word, stealers, stolen, donor, passers, passed, receiver)
+        word / donor / receiver are -1 where the action failed.
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        profiler = getattr(self.env, 'profiler', None)  #worker views carry no profiler
+        if profiler is not None:
+            return self._decide_profiled(rows, act, union, profiler)
+        formers, word = self._form(rows[act == 0], union)
+        stealers, stolen, donor = self._steal(rows[act == 1], union)
+        passers, passed, receiver = self._pass(rows[act == 2], union)
+        return formers, word, stealers, stolen, donor, passers, passed, receiver
+
+    def _decide_profiled(self, rows, act, union, profiler):
+        clock = profiler.clock
+        start = clock()
+        formers, word = self._form(rows[act == 0], union)
+        t1 = clock()
+        stealers, stolen, donor = self._steal(rows[act == 1], union)
+        t2 = clock()
+        passers, passed, receiver = self._pass(rows[act == 2], union)
+        t3 = clock()
+        decisions = formers, word, stealers, stolen, donor, passers, passed, receiver
+        self.profile_round(act, decisions, (t1 - start, t2 - t1, t3 - t2, 0.))
+        return decisions
+
+    def profile_round(self, act, decisions, seconds):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Book a round's actions into env.profiler, seconds per action type. Stealers without a needed
+        letter count as failed steals, as in _log_round.
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        formers, word, stealers, stolen, donor, passers, passed, receiver = decisions
+        n = np.bincount(act, minlength=4)
+        ok = (int((word >= 0).sum()), int((donor >= 0).sum()), int((receiver >= 0).sum()), int(n[3]))
+        for a in range(4):
+            self.env.profiler.record(a, seconds[a], int(n[a]), ok[a])
+
+    def apply_letters(self, decisions):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Land the successful steals and passes of a round in the hands.
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        formers, word, stealers, stolen, donor, passers, passed, receiver = decisions
+        ok = donor >= 0
+        self.stolen[stealers[ok], stolen[ok]] += 1
+        ok = receiver >= 0
+        np.add.at(self.received, (receiver[ok], passed[ok]), 1)
+
+    def finish_round(self, rows, act, decisions):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Book a round whose letters have landed: record formed words and give their agents new targets,
+        log hand changes and events, advance the clock.
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        env = self.env
+        formers, word, stealers, stolen, donor, passers, passed, receiver = decisions
+        formed = formers[word >= 0]
+        words = env.cand_index.words[word[word >= 0]]
+        env.words_formed.extend(zip(words.tolist(), formed.tolist()))
+        self.words_formed[formed] += 1
+        self.retarget(formed, self.union_rows(formed))  #get new target word
+
+        #log hand changes, stamped with the tick each acting agent holds within the round
+        tick = self.ticks(rows, np.concatenate([stealers, passers]))
+        ok = np.concatenate([donor, receiver]) >= 0
+        env.historical_states.record_batch(
+            tick[ok], np.concatenate([stealers, receiver])[ok],
+            np.repeat([1, 2], [len(stealers), len(passers)])[ok],
+            np.concatenate([stolen, passed])[ok])
+
+        if env.log.enabled:
+            self._log_round(rows, act, *decisions)
+
+        self.actions_taken[rows] += 1
+        env.time += self.round_length(rows)
+        env.historical_states.maybe_keyframe(env.time, env.state_counts)
+
+    def ticks(self, rows, who):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Clock tick at which each agent in who (a subset of the round's rows) acts within the round.
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        return self.env.time + np.searchsorted(rows, who)
+
+    def round_length(self, rows):
+        return len(rows)
+
+    def step(self, rows):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        One synchronous round for the agents in rows (ascending node numbers).
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        env = self.env
+        act = env.next_actions()[rows]
+        decisions = self.decide(rows, act, self.union())
+        with env._phase('apply_letters'):
+            self.apply_letters(decisions)
+        with env._phase('finish_round'):
+            self.finish_round(rows, act, decisions)
+        return act
+
+    def _log_round(self, rows, act, formers, word, stealers, stolen, donor, passers, passed, receiver):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Report the round to env.log as one batch of events, one per acting agent, in node order.
+        Stealers without a needed letter never searched and are reported as failed with letter -1.
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        letter = np.full(len(rows), -1, dtype=np.int64)
+        other = np.full(len(rows), -1, dtype=np.int64)
+        success = act == 3
+        for who, what, to in ((formers, None, word), (stealers, stolen, donor),
+                              (passers, passed, receiver)):
+            pos = np.searchsorted(rows, who)
+            if what is not None:
+                letter[pos] = what
+            other[pos] = to
+            success[pos] = to >= 0
+        self.env.log.events(self.ticks(rows, rows), rows, act, letter, other, success)
+
+    def play(self):
+        env = self.env
+        while env.time < env.time_max:
+            self.step(np.arange(min(self.n_agents, env.time_max - env.time)))
+            env._after_round()
+
+
+class ensemble_engine(array_engine):
+    #-----------------------------------------------------------------------------------------------#
+    '''
+    R independent replicates of one game (same graph and parameters, different random draws) played
+    in one process as one array_engine over R * N agents. Row r * N + i is node i of replicate r.
+
+    The adjacency is block diagonal, so steals and passes never leave a replicate, and every
+    replicate claims target words from its own row of env.corpus_available, an (R, words) mask over
+    the full corpus (env.cand_index is the full corpus index; a replicate's C^possible is the set of
+    words initially available to it). Replicates advance in lockstep: a round moves every replicate's
+    clock by the same N ticks, so env.time is the clock of each replicate and time_max applies to
+    each. With replicates=1 a game is identical to array_engine under the same seed.
+
+    For small graphs this turns R games into one set of batched operations per round instead of R
+    runs of per-round Python overhead.
+
+    PARMS:
+        env: an environment created with engine='array' and replicates=R
+        replicates: int, R
+        hand_size: int, letters dealt per agent
+
+    EXAMPLE:
+        env = environment(G, t_max=500, engine='array', replicates=200, seed=1)
+        env.set_env()
+        env.play()
+        env.arrays.replicate_summary()  #one dict per replicate
+    '''
+    #-----------------------------------------------------------------------------------------------#
+    def __init__(self, env, replicates, hand_size=5):
+        n = env.G.number_of_nodes()
+        self.n_nodes = n
+        self.replicates = replicates
+        array_engine.__init__(self, env, hand_size)
+        self.replicate = np.repeat(np.arange(replicates), n)
+        self.n_agents = n * replicates
+
+        #block diagonal CSR: replicate r's copy of the graph, shifted by r * N
+        degree = np.diff(env.indptr)
+        self.indptr = np.concatenate([[0], np.cumsum(np.tile(degree, replicates))])
+        self.indices = (env.indices[None, :] + n * np.arange(replicates)[:, None]).ravel()
+
+        self.strategy = np.tile(self.strategy, replicates)
+        self._allocate()
+
+    def find_cand_words(self):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Per replicate C^possible from its pooled initial letters, as rows of env.corpus_available.
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        env = self.env
+        pooled = self.initial.reshape(self.replicates, self.n_nodes, -1).sum(axis=1)
+        env.cand_index = env.corpus_index
+        env.corpus_available = np.stack([env.corpus_index.possible(p) for p in pooled])
+        env.corpus_possible = list(env.corpus_index.words[env.corpus_available.any(axis=0)])
+        env.log.message('total corpus size {}, possible words per replicate {:.1f} on average'.format(
+            len(env.corpus), env.corpus_available.sum(axis=1).mean()))
+
+    def retarget(self, rows, hands, chunk=4096):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        array_engine.retarget for every replicate at once. Claims within a replicate are made in row
+        order; the k-th claimant of every replicate is served in the same batched step, since
+        replicates never compete for a word.
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        cand = self.env.cand_index
+        avail = self.env.corpus_available
+        rep = self.replicate[rows]
+        rank = np.arange(len(rows)) - np.searchsorted(rep, rep)  #rows ascending, so grouped by replicate
+        self.target[rows] = -1
+        for k in range(rank.max() + 1 if len(rows) else 0):
+            sel = np.flatnonzero(rank == k)
+            for lo in range(0, len(sel), chunk):
+                part = sel[lo:lo + chunk]
+                r = rep[part]
+                w = np.where(avail[r], cand.score(hands[part]), -1).argmax(axis=1)
+                ok = avail[r, w]
+                avail[r[ok], w[ok]] = False
+                self.target[rows[part[ok]]] = w[ok]
+
+        has_target = self.target[rows] >= 0
+        self.target_counts[rows] = 0
+        self.target_counts[rows[has_target]] = cand.counts[self.target[rows[has_target]]]
+
+    def set_agents(self):
+        env = self.env
+        with env._phase('deal'):
+            self.deal()
+        with env._phase('_find_cand_words'):
+            self.find_cand_words()
+        with env._phase('_set_init_targets'):
+            self.retarget(np.arange(self.n_agents), self.initial)
+            env._push_to_historical()
+        env.time += 1
+
+    def ticks(self, rows, who):
+        return self.env.time + who % self.n_nodes
+
+    def round_length(self, rows):
+        return len(rows) // self.replicates
+
+    def play(self):
+        env = self.env
+        while env.time < env.time_max:
+            n_active = min(self.n_nodes, env.time_max - env.time)
+            rows = (np.arange(self.replicates)[:, None] * self.n_nodes + np.arange(n_active)).ravel()
+            self.step(rows)
+            env._after_round()
+
+    def replicate_summary(self):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        RETURNS:
+            list of dicts, per replicate: clock, words formed in total and per strategy type
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        formed = self.words_formed.reshape(self.replicates, self.n_nodes)
+        strategy = self.strategy[:self.n_nodes]
+        out = []
+        for r in range(self.replicates):
+            row = {'replicate': r, 'time': self.env.time, 'words_formed': int(formed[r].sum())}
+            for s in self.env.strategies():
+                row['words_' + s] = int(formed[r, strategy == s].sum())
+            out.append(row)
+        return out
@@ -1,7 +1,20 @@
-from utils.helpers import possible_words
+from utils.corpus import load_corpus, load_alphabet, RankCache, LookaheadIndex
+from utils.history import StateHistory, SLOTS
+from utils.events import make_sink
+from utils.helpers import csr_adjacency
+from utils.profiler import Profiler
+from utils.metrics import MetricsPublisher
+from utils.graphinit import STRATEGIES
 import numpy as np
 from agent import agent
+from engine import array_engine, ensemble_engine
+from parallel import partitioned_engine
 import itertools
+import heapq
+import json
+import weakref
+import networkx as nx
+from contextlib import nullcontext
 
 
 class environment(object):
@@ -11,10 +24,56 @@ class environment(object):
 
     PARMS:
         G: A networkx graph structure; G(V,E)
+        t_max: int, maximum number of actions (clock ticks) in a game
+        engine: str, 'object' runs one agent object per node. 'array' keeps the whole population in
+                dense arrays (engine.array_engine) and plays each round with batched operations.
+                'partitioned' splits the graph into n_parts and plays the array engine's rounds across
+                that many worker processes over shared memory (parallel.partitioned_engine).
+        seed: int or np.random.SeedSequence, seeds env.rng, the single Generator every random draw
+              of the game (hands, actions, letters chosen) comes from
+        action_block: int, number of rounds of actions pre-drawn at once
+        log: str, event sink mode, one of 'off', 'counters', 'print', 'jsonl', 'binary', 'npz',
+             'parquet' (see utils.events). 'off' does no formatting or bookkeeping at all.
+        log_path: str, output file for the 'jsonl' and 'binary' modes, output directory for the
+                  columnar 'npz' and 'parquet' modes
+        scheduler: str, 'round_robin' sweeps agents 0..N-1 once per round. 'event' gives every agent
+                   a Poisson clock and dispatches activations from a priority queue in continuous
+                   time (object engine only, see _play_events).
+        rate: str, activation rate of the event scheduler. 'uniform' (every agent once per unit of
+              time on average) or 'degree' (proportional to degree, mean rate 1)
+        replicates: int, with engine='array', play this many independent replicates of the game in one
+                    process as one batched engine (engine.ensemble_engine). Per replicate results
+                    come from env.arrays.replicate_summary().
+        target_cache: int, size of the LRU cache from hand to ranked closest words shared by every
+                      agent's target search (utils.corpus.RankCache). 0 or None turns it off.
+        lookahead: bool, steal and pass with one-letter lookahead (object engine only): a steal takes the
+                   needed letter a neighbor holds that also completes the most other available words,
+                   a pass gives the letter / neighbor pair completing the most words for the receiver.
+                   Uses a utils.corpus.LookaheadIndex over C^possible, in env.lookahead_index.
+        corpus: str, word list C, one word per line of any length (utils.corpus.load_corpus)
+        hand_size: int, letters dealt to every agent at t=0 (letters_initial)
+        profile: bool, collect per-action counts / times / outcomes and set_env phase timings in
+                 env.profiler (utils.profiler.Profiler). Off, env.profiler is None and costs nothing.
+        metrics_every: float, publish a live snapshot of the game (words per strategy, steal / pass
+                       success, steps per second, memory) every this many seconds of wall time during
+                       play() into a shared memory ring other processes can read, in env.metrics
+                       (utils.metrics.MetricsPublisher). None for no snapshots.
+        metrics_port: int, also serve the snapshots as JSON over HTTP on 127.0.0.1 (0 picks a free
+                      port, see env.metrics.address). Needs metrics_every.
 
     '''
     #-----------------------------------------------------------------------------------------------#
-    def __init__(self, G, t_max):
+    def __init__(self, G, t_max, engine='object', seed=None, action_block=64, log='off',
+                 log_path=None, scheduler='round_robin', rate='uniform', n_parts=2, replicates=1,
+                 target_cache=4096, lookahead=False, corpus='txt/five_letter_words.txt', hand_size=5,
+                 profile=False, metrics_every=None, metrics_port=None):
+        assert engine in ('object', 'array', 'partitioned'), 'Unknown engine {}'.format(engine)
+        assert scheduler in ('round_robin', 'event'), 'Unknown scheduler {}'.format(scheduler)
+        assert scheduler == 'round_robin' or engine == 'object', 'Event scheduler needs the object engine'
+        assert rate in ('uniform', 'degree'), 'Unknown rate {}'.format(rate)
+        assert replicates == 1 or engine == 'array', 'Replicates need the array engine'
+        assert not lookahead or engine == 'object', 'Lookahead strategies need the object engine'
+        assert metrics_port is None or metrics_every, 'metrics_port needs metrics_every'
 
         self.G = G
         self.nodes = G.nodes
@@ -24,17 +83,57 @@ class environment(object):
             'form_word', 'steal_letter', 'pass_letter', 'think'
         ]
         self.l_init_union = []
-        self.corpus = np.loadtxt(fname='txt/five_letter_words.txt',
-                                 dtype='str')
         self.corpus_possible = []
-        self.alphabet = np.loadtxt(fname='txt/alphabet_english.txt',
-                                   dtype='str')
+        self.corpus_available = np.zeros(0, dtype=bool)  #words in C^possible not yet claimed as a target
+        self.alphabet = load_alphabet('txt/alphabet_english.txt')
+        self.corpus_path = corpus
+        self.corpus_index = load_corpus(corpus, self.alphabet)  #letter counts / masks over C, memory-mapped
+        self.corpus = self.corpus_index.words
+        self.hand_size = hand_size
+        self.cand_index = None  #CorpusIndex restricted to C^possible
         self.nodeData = {}
+        self.indptr = None  #CSR adjacency frozen at set_env: neighbors of i are indices[indptr[i]:indptr[i+1]]
+        self.indices = None
+        self.hand_counts = None  #(agents, letters) counts of l_union_vi, which neighbor holds which letter
         self.current_state = {}  #at t
-        self.historical_states = {}  #pop from current state at t+1
+        self.historical_states = None  #utils.history.StateHistory, hand changes over time
         self.words_formed = []  #by player
         self.time = 0
-        self.time_max = 400
+        self.time_max = t_max
+        self.scheduler = scheduler
+        self.rate = rate
+        self.clock = 0.  #continuous time of the event scheduler
+        self.thinks_skipped = 0  #null actions the event scheduler accounted for without dispatching
+        self.engine = engine
+        self.rng = np.random.default_rng(seed)
+        self.action_block = action_block
+        self._action_cdf = None  #(agents, actions) cumulative p_act rows
+        self._actions = np.zeros((0, 0), dtype=np.int8)  #pre-drawn block, one row per round
+        self._actions_pos = 0
+        self.log = make_sink(log, log_path)
+        self.log.bind(self)
+        self.arrays = None  #array_engine state when engine is 'array' or 'partitioned'
+        self.n_parts = n_parts
+        self.replicates = replicates
+        self.target_cache = RankCache(maxsize=target_cache) if target_cache else None
+        self.lookahead = lookahead
+        self.lookahead_index = None  #LookaheadIndex over C^possible when lookahead is on
+        self.checkpoint_every = None  #ticks between checkpoints written by play()
+        self.checkpoint_path = None
+        self._last_checkpoint = 0
+        self.profiler = Profiler(self.action_space) if profile else None
+        self.metrics = None
+        if metrics_every:
+            self.metrics = MetricsPublisher(metrics_every, metrics_port)
+            weakref.finalize(self, self.metrics.close)  #release the shared memory with the environment
+
+    def _phase(self, name):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Context timing a named phase into env.profiler, a no-op context when profiling is off.
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        return nullcontext() if self.profiler is None else self.profiler.phase(name)
 
     def _getnodeData(self):
         #-----------------------------------------------------------------------------------------------#
@@ -47,24 +146,86 @@ class environment(object):
                                 [j for j in self.G.neighbors(i)],
                                 self.G.degree(i))
 
+    def _set_action_cdf(self):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Stack every node's p_act into a cumulative table for inverse-CDF sampling.
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        p_act = np.array([self.G.nodes[i]['atts'][1] for i in range(len(self.G.nodes))],
+                         dtype=float)
+        cdf = np.cumsum(p_act, axis=1)
+        self._action_cdf = cdf / cdf[:, -1:]  #p_act is rounded, make sure the last column is 1
+
+    def _draw_actions(self, n_rounds):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Draw actions for every agent for n_rounds rounds at once: one uniform block compared against
+        the cumulative p_act rows. Returns (n_rounds, agents) int8 indices into action_space.
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        u = self.rng.random((n_rounds, len(self._action_cdf), 1))
+        act = (u >= self._action_cdf).sum(axis=2, dtype=np.int8)
+        return np.minimum(act, len(self.action_space) - 1)
+
+    def next_actions(self):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Actions of every agent for the next round, served from the pre-drawn block.
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        if self._actions_pos >= len(self._actions):
+            n_rounds = max(1, min(self.action_block, 2**20 // max(len(self._action_cdf), 1)))
+            self._actions = self._draw_actions(n_rounds)
+            self._actions_pos = 0
+        self._actions_pos += 1
+        return self._actions[self._actions_pos - 1]
+
+    def sample_action(self, node):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Draw a single action for one agent outside of the round structure.
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        action = np.searchsorted(self._action_cdf[node], self.rng.random(), side='right')
+        return min(int(action), len(self.action_space) - 1)
+
+    def neighbors(self, node):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Neighbors of node, ascending, as a view into the CSR adjacency.
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        return self.indices[self.indptr[node]:self.indptr[node + 1]]
+
     def _find_cand_words(self):
         #-----------------------------------------------------------------------------------------------#
         '''
         '''
         #-----------------------------------------------------------------------------------------------#
-        l_init_union = [[i for l in d.values() for i in l]
-                        for d in self.current_state.values()
-                        ]  #Compute Union over all init letter dist
-        self.l_init_union = list(
-            itertools.chain(*l_init_union))  #flatten to 1d array
+        if self.arrays is not None:
+            pooled = self.arrays.initial.sum(axis=0)  #Union over all init letter dist, as counts
+        else:
+            l_init_union = [[i for l in d.values() for i in l]
+                            for d in self.current_state.values()
+                            ]  #Compute Union over all init letter dist
+            self.l_init_union = list(
+                itertools.chain(*l_init_union))  #flatten to 1d array
+            pooled = self.l_init_union
 
-        self.corpus_possible = possible_words(
-            self.corpus, self.l_init_union)  #find C^possible
+        possible = self.corpus_index.possible(pooled)  #find C^possible
+        self.cand_index = self.corpus_index.subset(possible)
+        self.corpus_possible = list(self.cand_index.words)
+        self.corpus_available = np.ones(len(self.cand_index), dtype=bool)
+        if self.target_cache is not None:
+            self.target_cache.clear(self.cand_index)
+        if self.lookahead:
+            self.lookahead_index = LookaheadIndex(self.cand_index)
 
         for i in self.agents:
-            self.agents[i].corpus = self.corpus_possible
+            self.agents[i].corpus = self.cand_index
 
-        print(
+        self.log.message(
             f'total corpus size {len(self.corpus)}, total count of possible words {len(self.corpus_possible)}'
         )
 
@@ -73,7 +234,22 @@ class environment(object):
         '''
         '''
         #-----------------------------------------------------------------------------------------------#
-        self.historical_states[self.time] = self.current_state
+        self.historical_states.keyframe(self.time, self.state_counts())
+
+    def state_counts(self):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Current letter state as an (agents, 3, letters) count array, slots ordered as utils.history.SLOTS
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        if self.arrays is not None:
+            return np.stack([self.arrays.initial, self.arrays.stolen, self.arrays.received], axis=1)
+        state = np.zeros((len(self.agents), len(SLOTS), len(self.alphabet)), dtype=np.int32)
+        for i, a in self.agents.items():
+            for s, key in enumerate(SLOTS):
+                for l in a.letters[key]:
+                    state[i, s, self.corpus_index.lookup[l]] += 1
+        return state
 
     def _set_init_targets(self):
         #-----------------------------------------------------------------------------------------------#
@@ -103,20 +279,23 @@ class environment(object):
         #-------------------------------------------------
         #Get init hand and pass back data to env.current_state
         #-------------------------------------------------
-        print('agents passed into env')
+        self.log.message('agents passed into env')
         self.agents = agents
 
-        [j.get_init_hand(self) for i, j in self.agents.items()
-         ]  #-> L_init(agent) & env.current_state
-        print('all agents assigned letters_initial')
+        with self._phase('get_init_hand'):
+            [j.get_init_hand(self) for i, j in self.agents.items()
+             ]  #-> L_init(agent) & env.current_state
+        self.log.message('all agents assigned letters_initial')
 
-        print('searching for candidate words C^possible in C')
-        self._find_cand_words(
-        )  #Find Candidate Words - C^Possible, given init letter distr
+        self.log.message('searching for candidate words C^possible in C')
+        with self._phase('_find_cand_words'):
+            self._find_cand_words(
+            )  #Find Candidate Words - C^Possible, given init letter distr
 
-        print('agents passed into env')
-        print('init target words set locally. Time counter incremented by 1')
-        self._set_init_targets()  #Set initial target word
+        self.log.message('agents passed into env')
+        self.log.message('init target words set locally. Time counter incremented by 1')
+        with self._phase('_set_init_targets'):
+            self._set_init_targets()  #Set initial target word
 
     def set_env(self):
         #-----------------------------------------------------------------------------------------------#
@@ -124,21 +303,327 @@ class environment(object):
         '''
         #-----------------------------------------------------------------------------------------------#
         assert len(self.alphabet) == 26, 'Alphabet size mismatch'
-        self._getnodeData()
-        self.set_agents()
-        print('Environment set - > Graph Created. Node attributes assigned.')
+        if self._action_cdf is None:
+            with self._phase('csr_adjacency'):
+                self._set_action_cdf()
+                self._action_cdf = np.tile(self._action_cdf, (self.replicates, 1))  #one row per engine row
+                self.indptr, self.indices = csr_adjacency(self.G)
+        self.historical_states = StateHistory(len(self.G.nodes) * self.replicates, len(self.alphabet))
+        if self.replicates > 1:
+            self.arrays = ensemble_engine(self, self.replicates, self.hand_size)
+            with self._phase('set_agents'):
+                self.arrays.set_agents()
+        elif self.engine == 'partitioned':
+            self.arrays = partitioned_engine(self, self.n_parts, self.hand_size)
+            with self._phase('set_agents'):
+                self.arrays.set_agents()
+        elif self.engine == 'array':
+            self.arrays = array_engine(self, self.hand_size)
+            with self._phase('set_agents'):
+                self.arrays.set_agents()
+        else:
+            self.hand_counts = np.zeros((len(self.G.nodes), len(self.alphabet)), dtype=np.int32)
+            with self._phase('_getnodeData'):
+                self._getnodeData()
+            with self._phase('set_agents'):
+                self.set_agents()
+        self.log.message('Environment set - > Graph Created. Node attributes assigned.')
 
     def output_logs(self):
-        pass
-    def play(self):
-        while self.time < self.time_max:
-            for j in range(0, len(self.agents)):
-                self.agents[j].take_action(self)
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Flush buffered events to the log file (if any), hand the run's summary to the sink (columnar
+        sinks append it to their runs table) and return the per-action counters.
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        self.log.flush()
+        self.log.write_run(self.summary())
+        return self.log.summary()
 
+    def strategies(self):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Every strategy type a node can have (utils.graphinit.STRATEGIES, plus any other found in G), sorted.
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        return sorted(set(STRATEGIES) | set(self.G.nodes[i]['atts'][0] for i in self.G.nodes))
 
-    def reset_env(self):
+    def summary(self):
         #-----------------------------------------------------------------------------------------------#
         '''
+        Per-run aggregates: clock, replicates, words formed in total and per strategy type, plus the event
+        sink counters (steals / passes attempted and succeeded) when logging is on. Summed over replicates.
+        The keys are the same for every graph: strategies missing from G report 0 words.
         '''
         #-----------------------------------------------------------------------------------------------#
-        pass
+        out = {'time': self.time, 'words_formed': len(self.words_formed), 'replicates': self.replicates}
+        for strategy in self.strategies():
+            out['words_' + strategy] = 0
+        n = len(self.G.nodes)
+        for word, node in self.words_formed:
+            out['words_' + self.G.nodes[node % n]['atts'][0]] += 1  #ensemble rows are replicate * N + node
+        out.update(self.log.summary())
+        return out
+
+    def _play_events(self, block=4096):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Event-driven scheduler. Agent i is activated by a Poisson clock of rate r_i (1, or degree / mean
+        degree). Activations that would sample 'think' change nothing, so they are thinned out up front:
+        the queue only holds meaningful activations, at rate r_i * (1 - p_think_i), and each one samples
+        from p_act conditioned on not thinking. The number of skipped thinks is drawn in bulk at the end.
+
+        The remaining tick budget maps to a horizon of (time_max - time) / N units of continuous time,
+        the expected length of that many round-robin ticks. env.time counts dispatched actions and
+        env.clock holds the time of the last one.
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        n = len(self.agents)
+        rate = np.ones(n)
+        if self.rate == 'degree':
+            degree = np.diff(self.indptr).astype(float)
+            rate = degree / degree.mean()
+
+        p_act = np.diff(self._action_cdf, axis=1, prepend=0.)
+        p_think = p_act[:, -1]
+        active = rate * (1 - p_think)  #rate of meaningful activations
+        cond_cdf = self._action_cdf[:, :-1] / np.maximum(1 - p_think, 1e-12)[:, None]
+
+        horizon = self.clock + (self.time_max - self.time) / n
+        start = self.clock
+        queue = [(self.clock + e / active[i], i)
+                 for i, e in enumerate(self.rng.standard_exponential(n)) if active[i] > 0]
+        heapq.heapify(queue)
+
+        u, e, k = self.rng.random(block), self.rng.standard_exponential(block), 0
+        while queue and self.time < self.time_max:
+            t, i = queue[0]
+            if t > horizon:
+                break
+            if k == block:
+                u, e, k = self.rng.random(block), self.rng.standard_exponential(block), 0
+                if self.metrics is not None and self.metrics.due():
+                    self.metrics.publish(self)
+            self.clock = t
+            action = min(int(np.searchsorted(cond_cdf[i], u[k], side='right')), len(self.action_space) - 2)
+            self.agents[i].take_action(self, action)
+            heapq.heapreplace(queue, (t + e[k] / active[i], i))
+            k += 1
+
+        if self.time < self.time_max:
+            self.clock = horizon  #ran out of events before the tick budget
+        self.thinks_skipped += int(self.rng.poisson(rate * p_think * (self.clock - start)).sum())
+
+    def _checkpoint_due(self):
+        return bool(self.checkpoint_every) and self.time - self._last_checkpoint >= self.checkpoint_every
+
+    def _after_round(self):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Called by every round-based play loop between rounds, when the game state is consistent.
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        if self._checkpoint_due():
+            self.save_checkpoint(self.checkpoint_path)
+        if self.metrics is not None and self.metrics.due():
+            self.metrics.publish(self)
+
+    def play(self, checkpoint_every=None, checkpoint_path=None):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        PARMS:
+            checkpoint_every: int, ticks between checkpoints (written between rounds). None for none.
+            checkpoint_path: str, checkpoint file, overwritten each time
+        RETURNS:
+            dict, summary() of the game
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        if checkpoint_every:
+            assert checkpoint_path is not None, 'checkpoint_every needs a checkpoint_path'
+            assert self.scheduler == 'round_robin', 'Checkpoints are taken between rounds'
+            self.checkpoint_every, self.checkpoint_path = checkpoint_every, checkpoint_path
+            self._last_checkpoint = self.time
+        if self.metrics is not None:
+            self.metrics.start(self)
+
+        with self._phase('play'):
+            if self.arrays is not None:
+                self.arrays.play()
+            elif self.scheduler == 'event':
+                self._play_events()
+            else:
+                while self.time < self.time_max:
+                    actions = self.next_actions()
+                    for j in range(0, len(self.agents)):
+                        if self.time >= self.time_max:
+                            break
+                        self.agents[j].take_action(self, actions[j])
+                    self._after_round()
+        self.checkpoint_every = None
+        self.output_logs()
+        if self.metrics is not None:
+            self.metrics.publish(self, done=True)
+        return self.summary()
+
+    def save_checkpoint(self, path):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Save the full game to a single compressed .npz file: graph, hands, targets, claimed words, RNG
+        state, pre-drawn actions, clock, history and counters. environment.load_checkpoint(path) resumes
+        it bit-exactly (object and array engines, round_robin scheduler, saved between rounds).
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        assert self.replicates == 1, 'Ensembles cannot be checkpointed, checkpoint single games'
+        self.log.flush()  #the log output then holds exactly the events up to the checkpoint
+        n = len(self.G.nodes)
+        edges = np.array(self.G.edges(), dtype=np.int64).reshape(-1, 2)
+        if self.arrays is not None:
+            a = self.arrays
+            hand_initial, stolen, received = a.hand_initial, a.stolen, a.received
+            target, actions_taken, words_formed = a.target, a.actions_taken, a.words_formed
+        else:
+            state = self.state_counts()
+            stolen, received = state[:, 1], state[:, 2]
+            hand_initial = np.array([[self.corpus_index.lookup[l] for l in self.agents[i].letters['letters_initial']]
+                                     for i in range(n)], dtype=np.int64)
+            target = np.array([self.agents[i].target_index for i in range(n)], dtype=np.int64)
+            actions_taken = np.array([self.agents[i].actions_taken for i in range(n)], dtype=np.int64)
+            words_formed = np.array([self.agents[i].words_formed for i in range(n)], dtype=np.int64)
+
+        hist = self.historical_states
+        meta = {
+            'engine': self.engine, 'time': self.time, 'time_max': self.time_max,
+            'scheduler': self.scheduler, 'rate': self.rate, 'clock': self.clock,
+            'thinks_skipped': self.thinks_skipped, 'action_block': self.action_block,
+            'n_parts': self.n_parts, 'actions_pos': self._actions_pos,
+            'rng': self.rng.bit_generator.state, 'words_formed': self.words_formed,
+            'strategies': [self.G.nodes[i]['atts'][0] for i in range(n)],
+            'corpus': self.corpus_path, 'corpus_size': len(self.corpus),
+            'hand_size': self.hand_size, 'lookahead': self.lookahead,
+            'log_position': self.log.position(),
+            'target_cache': self.target_cache.maxsize if self.target_cache is not None else 0,
+            'keyframe_times': hist.keyframe_times,
+            'keyframe_events': hist.keyframe_events, 'keyframe_every': hist.keyframe_every,
+        }
+        cand = np.flatnonzero(np.isin(self.corpus, self.cand_index.words))
+        np.savez_compressed(
+            path, meta=np.array(json.dumps(meta, default=int)),
+            p_act=np.array([self.G.nodes[i]['atts'][1] for i in range(n)], dtype=float),
+            edges=edges, weights=np.array([self.G.edges[e].get('weight', np.nan) for e in map(tuple, edges)]),
+            hand_initial=hand_initial, stolen=stolen, received=received, target=target,
+            actions_taken=actions_taken, agent_words_formed=words_formed, cand=cand,
+            corpus_available=self.corpus_available, actions=self._actions,
+            log_counts=getattr(self.log, 'counts', np.zeros(0)),
+            events=hist.events[:hist.n_events], keyframes=np.stack(hist.keyframes))
+        self._last_checkpoint = self.time
+
+    @classmethod
+    def load_checkpoint(cls, path, log='off', log_path=None, profile=False, metrics_every=None,
+                        metrics_port=None):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Rebuild an environment from save_checkpoint(path). Call play() to continue the game.
+
+        A file or columnar log at the log_path of the checkpointed game is continued: the events logged up
+        to the checkpoint are kept, anything logged after it is dropped, and the resumed game appends.
+        log, log_path, profile, metrics_every and metrics_port are options of the resumed process, as in
+        environment(); everything else comes from the checkpoint.
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        data = np.load(path)
+        meta = json.loads(str(data['meta']))
+
+        G = nx.Graph()
+        G.add_nodes_from((i, {'atts': (s, p)}) for i, (s, p) in enumerate(zip(meta['strategies'], data['p_act'])))
+        G.add_weighted_edges_from((int(u), int(v), w) for (u, v), w in zip(data['edges'], data['weights']))
+
+        env = cls(G, meta['time_max'], engine=meta['engine'], action_block=meta['action_block'],
+                  log='off', scheduler=meta['scheduler'], rate=meta['rate'],
+                  n_parts=meta['n_parts'], corpus=meta['corpus'], hand_size=meta['hand_size'],
+                  lookahead=meta['lookahead'], target_cache=meta['target_cache'], profile=profile,
+                  metrics_every=metrics_every, metrics_port=metrics_port)
+        assert len(env.corpus) == meta['corpus_size'], 'Checkpoint was written with a different corpus'
+        env.log = make_sink(log, log_path)
+        env.log.bind(env, resume=meta.get('log_position'))
+        env._restore(data, meta)
+        return env
+
+    def _restore(self, data, meta):
+        n = len(self.G.nodes)
+        self._set_action_cdf()
+        self.indptr, self.indices = csr_adjacency(self.G)
+        self.time, self.clock, self.thinks_skipped = meta['time'], meta['clock'], meta['thinks_skipped']
+        self.words_formed = [tuple(w) for w in meta['words_formed']]
+        self.rng.bit_generator.state = meta['rng']
+        self._actions, self._actions_pos = data['actions'], meta['actions_pos']
+        if len(data['log_counts']) and hasattr(self.log, 'counts'):
+            self.log.counts[:] = data['log_counts']
+
+        hist = self.historical_states = StateHistory(n, len(self.alphabet), meta['keyframe_every'])
+        hist.record_batch(data['events']['time'], data['events']['node'], data['events']['slot'],
+                          data['events']['letter'], data['events']['delta'])
+        hist.keyframe_times, hist.keyframe_events = meta['keyframe_times'], meta['keyframe_events']
+        hist.keyframes = list(data['keyframes'])
+
+        self.cand_index = self.corpus_index.subset(data['cand'])
+        self.corpus_possible = list(self.cand_index.words)
+        self.corpus_available = data['corpus_available'].copy()
+        if self.target_cache is not None:
+            self.target_cache.clear(self.cand_index)
+        if self.lookahead:
+            self.lookahead_index = LookaheadIndex(self.cand_index)
+
+        hand_initial, target = data['hand_initial'], data['target']
+        if self.engine != 'object':
+            self.arrays = (partitioned_engine(self, self.n_parts, self.hand_size) if self.engine == 'partitioned'
+                           else array_engine(self, self.hand_size))
+            a = self.arrays
+            a.hand_initial = hand_initial.copy()
+            a.initial[:] = np.stack([np.bincount(h, minlength=len(self.alphabet)) for h in hand_initial])
+            a.stolen[:], a.received[:] = data['stolen'], data['received']
+            a.target[:] = target
+            has_target = target >= 0
+            a.target_counts[has_target] = self.cand_index.counts[target[has_target]]
+            a.actions_taken[:], a.words_formed[:] = data['actions_taken'], data['agent_words_formed']
+            return
+
+        self.hand_counts = np.zeros((n, len(self.alphabet)), dtype=np.int32)
+        self._getnodeData()
+        self.agents = {i: agent(node_number=i, G=self.G, env=self) for i in range(n)}
+        for i, a in self.agents.items():
+            a.corpus = self.cand_index
+            a.letters['letters_initial'] = self.alphabet[hand_initial[i]]
+            a.letters['letters_stolen'] = list(np.repeat(self.alphabet, data['stolen'][i]))
+            a.letters['letters_received'] = list(np.repeat(self.alphabet, data['received'][i]))
+            a.counts[:] = np.bincount(hand_initial[i], minlength=len(self.alphabet)) + \
+                data['stolen'][i] + data['received'][i]
+            a.target_index = int(target[i])
+            if a.target_index >= 0:
+                a.target_word = [l for l in self.cand_index.words[a.target_index]]
+                a.target_counts[:] = self.cand_index.counts[a.target_index]
+            a._find_needed_letters()
+            a.actions_taken = int(data['actions_taken'][i])
+            a.words_formed = int(data['agent_words_formed'][i])
+            self.current_state[i] = a.letters
+
+    def reset_env(self, seed=None):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Start a new game on the same graph and corpus: clear the clock, words, history and counters, deal
+        new hands and set new targets. The graph, CSR adjacency, action table and loaded corpus are kept.
+
+        PARMS:
+            seed: reseeds env.rng if given, otherwise the game continues the current random stream
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        if seed is not None:
+            self.rng = np.random.default_rng(seed)
+        self.time, self.clock, self.thinks_skipped = 0, 0., 0
+        self.words_formed = []
+        self.current_state = {}
+        self.l_init_union = []
+        self._actions, self._actions_pos = np.zeros((0, 0), dtype=np.int8), 0
+        self.log.reset()
+        if self.profiler is not None:
+            self.profiler.reset()
+        self.set_env()
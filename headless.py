@@ -0,0 +1,108 @@
+import json
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from utils.graphinit import Network
+from env import environment
+
+#-----------------------------------------------------------------------------------------------#
+'''
+Headless entry point: builds a graph and plays one game with no plotting, table or verbose output.
+Imports only what a game needs (numpy, networkx and the simulation modules), never matplotlib or
+pandas, so sweep workers start quickly. import_time() measures the cost in a fresh interpreter.
+
+EXAMPLE:
+    python headless.py --num-nodes 50 --t-max 5000 --engine array --seed 1
+    python headless.py --import-time
+
+    from headless import run_game
+    run_game({'num_nodes': 50, 'engine': 'array'}, seed=1)
+'''
+#-----------------------------------------------------------------------------------------------#
+
+DEFAULTS = {
+    'num_nodes': 5,
+    'prob_edges': 0.5,
+    'pr_selfish': 0.5,
+    'p_star': 0.20,
+    'topology': 'gnp',
+    'connect': 'resample',
+    't_max': 500,
+    'engine': 'object',
+    'corpus': 'txt/five_letter_words.txt',
+    'hand_size': 5,
+}
+
+
+def run_game(params, seed=None, log='counters'):
+    #-----------------------------------------------------------------------------------------------#
+    '''
+    Build a graph and an environment for one parameter set, play it headless and summarize it.
+
+    PARMS:
+        params: dict, see DEFAULTS. Missing parameters take the defaults.
+        seed: int or np.random.SeedSequence, split into independent streams for the graph and the game
+        log: str, event sink mode of the environment
+    RETURNS:
+        dict, params merged with environment.summary() and the run time in seconds
+    '''
+    #-----------------------------------------------------------------------------------------------#
+    start = time.perf_counter()
+    params = dict(DEFAULTS, **params)
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    graph_seed, env_seed = seed.spawn(2)
+    G, _ = Network(params['num_nodes'], params['prob_edges'], params['pr_selfish'],
+                   params['p_star'], seed=graph_seed, topology=params['topology'],
+                   connect=params['connect']).make_random_graph(plot=False, print_table=False)
+    env = environment(G, t_max=params['t_max'], engine=params['engine'], seed=env_seed, log=log,
+                      corpus=params['corpus'], hand_size=params['hand_size'])
+    env.set_env()
+    out = dict(params)
+    out.update(env.play())
+    out['seconds'] = time.perf_counter() - start
+    return out
+
+
+def import_time(module='headless', repeat=5):
+    #-----------------------------------------------------------------------------------------------#
+    '''
+    Seconds to import module in a fresh interpreter (best of repeat), plus whether matplotlib or
+    pandas got pulled in on the way.
+    '''
+    #-----------------------------------------------------------------------------------------------#
+    code = ('import sys, time; t = time.perf_counter(); import {}; t = time.perf_counter() - t; '
+            'print(t, "matplotlib" in sys.modules, "pandas" in sys.modules)').format(module)
+    best = None
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+        seconds, mpl, pd = out.stdout.split()
+        best = min(best or float('inf'), float(seconds))
+    return {'module': module, 'seconds': best, 'matplotlib': mpl == 'True', 'pandas': pd == 'True'}
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Play one game headless and print its summary')
+    parser.add_argument('--num-nodes', type=int, default=DEFAULTS['num_nodes'])
+    parser.add_argument('--prob-edges', type=float, default=DEFAULTS['prob_edges'])
+    parser.add_argument('--pr-selfish', type=float, default=DEFAULTS['pr_selfish'])
+    parser.add_argument('--p-star', type=float, default=DEFAULTS['p_star'])
+    parser.add_argument('--topology', default=DEFAULTS['topology'])
+    parser.add_argument('--connect', default=DEFAULTS['connect'])
+    parser.add_argument('--t-max', type=int, default=DEFAULTS['t_max'])
+    parser.add_argument('--engine', default=DEFAULTS['engine'])
+    parser.add_argument('--corpus', default=DEFAULTS['corpus'])
+    parser.add_argument('--hand-size', type=int, default=DEFAULTS['hand_size'])
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--import-time', action='store_true', help='measure the import cost and exit')
+    args = parser.parse_args()
+
+    if args.import_time:
+        print(json.dumps(import_time()))
+    else:
+        params = {k: v for k, v in vars(args).items() if k in DEFAULTS}
+        print(json.dumps(run_game(params, args.seed)))
@@ -3,7 +3,6 @@ from utils.graphinit import Network
 from agent import agent
 from env import environment
 import warnings
-import pandas as pd
 
 warnings.filterwarnings("ignore", category=UserWarning)
 
@@ -22,7 +21,7 @@ if __name__ == '__main__':
                       p_star).make_random_graph(plot=True, print_table=True)
 
 
-    env = environment(G, t_max= 500)
+    env = environment(G, t_max= 500, log='print')
 
     env.set_env()
     env.play()
@@ -0,0 +1,315 @@
+from __future__ import print_function
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from types import SimpleNamespace
+
+import numpy as np
+
+from engine import array_engine
+from utils.helpers import csr_gather
+
+
+def partition_graph(indptr, indices, n_parts):
+    #-----------------------------------------------------------------------------------------------#
+    '''
+    Split the nodes of a CSR graph into n_parts parts of (nearly) equal size. Nodes are ordered by a
+    breadth first search and the order is cut into contiguous chunks, so most neighbors of a node land
+    in its own part and few steal / pass events cross a partition boundary.
+
+    RETURNS:
+        (nodes,) int array, the part of every node
+    '''
+    #-----------------------------------------------------------------------------------------------#
+    n = len(indptr) - 1
+    order = np.empty(n, dtype=np.int64)
+    seen = np.zeros(n, dtype=bool)
+    pos = 0
+    while pos < n:
+        frontier = np.array([np.argmin(seen)])  #first unseen node, one BFS per component
+        seen[frontier] = True
+        while len(frontier):
+            order[pos:pos + len(frontier)] = frontier
+            pos += len(frontier)
+            _, nbrs = csr_gather(indptr, indices, frontier)
+            frontier = np.unique(nbrs[~seen[nbrs]])
+            seen[frontier] = True
+
+    part = np.empty(n, dtype=np.int64)
+    part[order] = np.arange(n) * n_parts // max(n, 1)
+    return part
+
+
+class _union_view(object):
+    #-----------------------------------------------------------------------------------------------#
+    '''
+    Sum of the initial / stolen / received count arrays, computed only for the rows that get indexed.
+    '''
+    #-----------------------------------------------------------------------------------------------#
+    def __init__(self, *parts):
+        self.parts = parts
+
+    def __getitem__(self, key):
+        return sum(p[key] for p in self.parts)
+
+
+def _attach(shared):
+    blocks, arrays = [], {}
+    for name, (shm_name, shape, dtype) in shared.items():
+        shm = shared_memory.SharedMemory(name=shm_name)
+        blocks.append(shm)
+        arrays[name] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    return blocks, arrays
+
+
+class _event_buffer(object):
+    #-----------------------------------------------------------------------------------------------#
+    '''
+    Stand-in for env.log inside a worker: keeps the batches _log_round reports until the next flush.
+    '''
+    #-----------------------------------------------------------------------------------------------#
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.batches = []
+
+    def events(self, *columns):
+        self.batches.append(columns)
+
+    def take(self):
+        columns = [np.concatenate(c) for c in zip(*self.batches)] if self.batches else None
+        self.batches = []
+        return columns
+
+
+class _worker_view(array_engine):
+    #-----------------------------------------------------------------------------------------------#
+    '''
+    array_engine over the shared arrays, as seen by one worker. Its rows are a subset of the round's
+    0..n_active-1, so the tick of a node within a round is env.time + node.
+    '''
+    #-----------------------------------------------------------------------------------------------#
+    def ticks(self, rows, who):
+        return self.env.time + who
+
+
+def _worker(conn, spec):
+    #-----------------------------------------------------------------------------------------------#
+    '''
+    Worker process owning the agents spec['rows']. Per round it decides the actions of its agents from
+    the shared hands ('round') and answers with only what the coordinator needs: the words formed and
+    the passes into other parts. After the barrier it lands the letters its own agents gained, including
+    passes routed in from other parts ('commit'). Only the owning worker ever writes a row.
+
+    History and log events of its agents stay in the worker until the coordinator asks for them
+    ('flush'), at keyframes, checkpoints and the end of play().
+    '''
+    #-----------------------------------------------------------------------------------------------#
+    blocks, arrays = _attach(spec['shared'])
+    own, part, me = spec['rows'], spec['part'], spec['part_id']
+    cdf = spec['cdf']
+    rng = np.random.default_rng(spec['seed'])
+
+    view = _worker_view.__new__(_worker_view)
+    view.env = SimpleNamespace(rng=rng, time=0, log=_event_buffer(spec['log']))
+    view.indptr, view.indices = spec['indptr'], spec['indices']
+    view.hand_size = spec['hand_size']
+    view.hand_initial = arrays['hand_initial']
+    view.target = arrays['target']
+    view.target_counts = arrays['target_counts']
+    union = _union_view(arrays['initial'], arrays['stolen'], arrays['received'])
+    history = []  #(tick, node, slot, letter) batches not yet flushed
+
+    pending = None
+    try:
+        while True:
+            msg = conn.recv()
+            if msg[0] == 'stop':
+                break
+            if msg[0] == 'round':
+                k = np.searchsorted(own, msg[1])
+                view.env.time = msg[2]
+                rows = own[:k]
+                u = rng.random((k, 1))
+                act = np.minimum((u >= cdf[:k]).sum(axis=1), cdf.shape[1] - 1)
+                decisions = view.decide(rows, act, union)
+                formers, word, stealers, stolen, donor, passers, passed, receiver = decisions
+                pending = rows, act, decisions
+                cross = (receiver >= 0) & (part[np.maximum(receiver, 0)] != me)
+                formed = word >= 0
+                counts = np.bincount(act, minlength=4)
+                ok = ((word >= 0).sum(), (donor >= 0).sum(), (receiver >= 0).sum(), counts[3])
+                conn.send(((formers[formed], word[formed]), (receiver[cross], passed[cross]), counts, ok))
+            elif msg[0] == 'commit':
+                rows, act, decisions = pending
+                formers, word, stealers, stolen, donor, passers, passed, receiver = decisions
+                ok = donor >= 0
+                arrays['stolen'][stealers[ok], stolen[ok]] += 1
+                local = (receiver >= 0) & (part[np.maximum(receiver, 0)] == me)
+                incoming_rows, incoming_letters = msg[1]
+                np.add.at(arrays['received'],
+                          (np.concatenate([receiver[local], incoming_rows]),
+                           np.concatenate([passed[local], incoming_letters])), 1)
+                arrays['actions_taken'][rows] += 1
+
+                landed = np.concatenate([donor, receiver]) >= 0
+                history.append((view.ticks(rows, np.concatenate([stealers, passers]))[landed],
+                                np.concatenate([stealers, receiver])[landed],
+                                np.repeat([1, 2], [len(stealers), len(passers)])[landed],
+                                np.concatenate([stolen, passed])[landed]))
+                if view.env.log.enabled:
+                    view._log_round(rows, act, *decisions)
+                conn.send('ok')
+            elif msg[0] == 'flush':
+                events = [np.concatenate(c) for c in zip(*history)] if history else None
+                history = []
+                conn.send((events, view.env.log.take()))
+    finally:
+        del view, union, arrays
+        for shm in blocks:
+            shm.close()
+
+
+class partitioned_engine(array_engine):
+    #-----------------------------------------------------------------------------------------------#
+    '''
+    array_engine whose rounds are spread over n_parts worker processes.
+
+    The graph is split with partition_graph and each worker owns the agents of one part. The hand,
+    target and action count arrays live in shared memory for the duration of play(). A round runs in
+    two phases:
+
+        1. every worker samples actions for its agents (own RNG stream) and resolves them against the
+           shared hands, which nobody writes during this phase. It sends back only the words its agents
+           formed and the passes into other parts.
+        2. barrier: passes into another part are routed to that part's worker, every worker lands the
+           letters its own agents gained and stores the round's history and log events, then the
+           coordinator books the formed words and gives their agents new targets
+
+    The per-round exchange is O(words formed + cross-partition passes), not O(agents). History and log
+    events are merged into env.historical_states / env.log only when a keyframe or checkpoint is due and
+    at the end of play(), so a printing sink prints in bursts and the live metrics' steal / pass rates
+    lag until then. Retargeting stays serial in the coordinator: target words are claimed from one
+    shared pool in node order.
+
+    Rounds are synchronous exactly as in array_engine, so results are statistically equivalent to it;
+    only the random streams differ. Worker streams are spawned from env.rng when play() starts, so a
+    checkpoint taken during play() resumes a valid game but not bit-exactly.
+
+    The speedup over array_engine with more cores is unverified: on a single core the worker round trips
+    make it slower than array_engine.
+
+    PARMS:
+        env: an environment created with engine='partitioned'
+        n_parts: int, number of worker processes
+    '''
+    #-----------------------------------------------------------------------------------------------#
+    shared_names = ['hand_initial', 'initial', 'stolen', 'received', 'target', 'target_counts',
+                    'actions_taken']
+
+    def __init__(self, env, n_parts=2, hand_size=5):
+        array_engine.__init__(self, env, hand_size)
+        self.n_parts = n_parts
+        self.part = partition_graph(self.indptr, self.indices, n_parts)
+
+    def _share(self):
+        blocks, shared = [], {}
+        for name in self.shared_names:
+            arr = getattr(self, name)
+            shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+            view = np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)
+            view[:] = arr
+            setattr(self, name, view)
+            blocks.append(shm)
+            shared[name] = (shm.name, arr.shape, arr.dtype.str)
+        return blocks, shared
+
+    def _unshare(self, blocks):
+        for name in self.shared_names:
+            setattr(self, name, np.array(getattr(self, name)))
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+    def _flush(self, conns):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Collect the history and log events the workers hold and record them in tick order.
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        env = self.env
+        for c in conns:
+            c.send(('flush',))
+        results = [c.recv() for c in conns]
+        events = [r[0] for r in results if r[0] is not None]
+        if events:
+            env.historical_states.record_batch(*[np.concatenate(c) for c in zip(*events)])
+        logged = [r[1] for r in results if r[1] is not None]
+        if logged:
+            columns = [np.concatenate(c) for c in zip(*logged)]
+            order = np.argsort(columns[0], kind='stable')
+            env.log.events(*[c[order] for c in columns])
+        self._unflushed = 0
+
+    def play(self):
+        env = self.env
+        hist = env.historical_states
+        seeds = np.random.SeedSequence(env.rng.integers(2**63)).spawn(self.n_parts)
+        blocks, shared = self._share()
+        conns, procs = [], []
+        self._unflushed = 0  #history events still held by the workers
+        try:
+            for p in range(self.n_parts):
+                rows = np.flatnonzero(self.part == p)
+                spec = {'shared': shared, 'rows': rows, 'part': self.part, 'part_id': p,
+                        'cdf': env._action_cdf[rows], 'seed': seeds[p], 'indptr': self.indptr,
+                        'indices': self.indices, 'hand_size': self.hand_size,
+                        'log': env.log.enabled}
+                parent, child = mp.Pipe()
+                proc = mp.Process(target=_worker, args=(child, spec), daemon=True)
+                proc.start()
+                conns.append(parent)
+                procs.append(proc)
+
+            while env.time < env.time_max:
+                n_active = min(self.n_agents, env.time_max - env.time)
+                for c in conns:
+                    c.send(('round', n_active, env.time))
+                results = [c.recv() for c in conns]
+
+                #barrier: route cross-partition passes to the worker owning the receiver
+                cross_rows = np.concatenate([r[1][0] for r in results])
+                cross_letters = np.concatenate([r[1][1] for r in results])
+                owner = self.part[cross_rows]
+                for p, c in enumerate(conns):
+                    c.send(('commit', (cross_rows[owner == p], cross_letters[owner == p])))
+                for c in conns:
+                    c.recv()
+
+                formed = np.concatenate([r[0][0] for r in results])
+                word = np.concatenate([r[0][1] for r in results])
+                order = np.argsort(formed, kind='stable')
+                formed, word = formed[order], word[order]
+                env.words_formed.extend(zip(env.cand_index.words[word].tolist(), formed.tolist()))
+                self.words_formed[formed] += 1
+                self.retarget(formed, self.union_rows(formed))  #get new target word
+
+                ok = sum(np.asarray(r[3]) for r in results)
+                self._unflushed += int(ok[1] + ok[2])  #one history event per landed steal / pass
+                if env.profiler is not None:
+                    counts = sum(r[2] for r in results)
+                    for a in range(4):  #action times stay in the workers
+                        env.profiler.record(a, np.nan, int(counts[a]), int(ok[a]))
+
+                env.time += n_active
+                if hist.n_events + self._unflushed - hist.keyframe_events[-1] >= hist.keyframe_every:
+                    self._flush(conns)
+                    hist.maybe_keyframe(env.time, env.state_counts)
+                if env._checkpoint_due():
+                    self._flush(conns)
+                env._after_round()
+            self._flush(conns)
+        finally:
+            for c in conns:
+                c.send(('stop',))
+            for proc in procs:
+                proc.join()
+            self._unshare(blocks)
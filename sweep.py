@@ -0,0 +1,107 @@
+import argparse
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from headless import DEFAULTS, run_game
+
+#-----------------------------------------------------------------------------------------------#
+'''
+Parallel Monte Carlo sweep over Network / environment parameters.
+
+Every (parameter combination, replicate) pair is an independent game run in a worker process with
+its own RNG stream spawned from one root seed, so a sweep is reproducible and replicates never share
+random numbers. Per-run summaries are appended to a JSONL results file as runs complete.
+
+EXAMPLE:
+    python sweep.py --num-nodes 10 50 --prob-edges 0.2 0.5 --pr-selfish 0.25 0.5 0.75 \\
+                    --p-star 0.2 --replicates 20 --t-max 2000 --out results.jsonl
+
+    from sweep import run_sweep
+    run_sweep({'num_nodes': [10, 50], 'pr_selfish': [0.25, 0.75]}, replicates=20)
+'''
+#-----------------------------------------------------------------------------------------------#
+
+
+def expand_grid(grid):
+    #-----------------------------------------------------------------------------------------------#
+    '''
+    PARMS:
+        grid: dict, parameter name -> list of values. Missing parameters take DEFAULTS.
+    RETURNS:
+        list of dicts, the cartesian product of the grid
+    '''
+    #-----------------------------------------------------------------------------------------------#
+    grid = dict({k: [v] for k, v in DEFAULTS.items()}, **grid)
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+
+
+def run_sweep(grid, replicates=1, out='results.jsonl', workers=None, seed=0):
+    #-----------------------------------------------------------------------------------------------#
+    '''
+    Run every parameter combination in grid replicates times across a process pool.
+
+    PARMS:
+        grid: dict, parameter name -> list of values (see expand_grid)
+        replicates: int, runs per parameter combination
+        out: str, JSONL results file. One line per finished run, appended as runs complete.
+        workers: int, worker processes. Defaults to os.cpu_count().
+        seed: int, root seed. Run k of the sweep always gets the k-th spawned stream.
+    RETURNS:
+        number of runs completed
+    '''
+    #-----------------------------------------------------------------------------------------------#
+    tasks = [(p, r) for p in expand_grid(grid) for r in range(replicates)]
+    seeds = np.random.SeedSequence(seed).spawn(len(tasks))
+
+    done = 0
+    with open(out, 'a') as f, ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for k, ((params, replicate), child) in enumerate(zip(tasks, seeds)):
+            futures[pool.submit(run_game, params, child)] = (k, replicate)
+        for future in as_completed(futures):
+            k, replicate = futures[future]
+            row = future.result()
+            row.update({'run': k, 'replicate': replicate, 'seed': seed})
+            f.write(json.dumps(row) + '\n')
+            f.flush()
+            done += 1
+    return done
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Parallel parameter sweep')
+    parser.add_argument('--num-nodes', type=int, nargs='+', default=[DEFAULTS['num_nodes']])
+    parser.add_argument('--prob-edges', type=float, nargs='+', default=[DEFAULTS['prob_edges']])
+    parser.add_argument('--pr-selfish', type=float, nargs='+', default=[DEFAULTS['pr_selfish']])
+    parser.add_argument('--p-star', type=float, nargs='+', default=[DEFAULTS['p_star']])
+    parser.add_argument('--topology', nargs='+', default=[DEFAULTS['topology']])
+    parser.add_argument('--connect', nargs='+', default=[DEFAULTS['connect']])
+    parser.add_argument('--t-max', type=int, nargs='+', default=[DEFAULTS['t_max']])
+    parser.add_argument('--engine', nargs='+', default=[DEFAULTS['engine']])
+    parser.add_argument('--corpus', nargs='+', default=[DEFAULTS['corpus']])
+    parser.add_argument('--hand-size', type=int, nargs='+', default=[DEFAULTS['hand_size']])
+    parser.add_argument('--replicates', type=int, default=1)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default='results.jsonl')
+    args = parser.parse_args()
+
+    grid = {
+        'num_nodes': args.num_nodes,
+        'prob_edges': args.prob_edges,
+        'pr_selfish': args.pr_selfish,
+        'p_star': args.p_star,
+        'topology': args.topology,
+        'connect': args.connect,
+        't_max': args.t_max,
+        'engine': args.engine,
+        'corpus': args.corpus,
+        'hand_size': args.hand_size,
+    }
+    n = run_sweep(grid, args.replicates, args.out, args.workers, args.seed)
+    print('{} runs written to {}'.format(n, os.path.abspath(args.out)))
@@ -0,0 +1,483 @@
+import hashlib
+import os
+import tempfile
+from collections import OrderedDict
+import numpy as np
+
+_LOADED = {}  #per-process memo of loaded corpora and alphabets, keyed by source file
+_MASK64 = (1 << 64) - 1
+
+
+class CorpusIndex(object):
+    #-----------------------------------------------------------------------------------------------#
+    '''
+    Precomputed letter index over a word corpus. Built once when the environment loads the corpus
+    so that candidate filtering and word scoring become array operations instead of per-word scans.
+    Words may have any length.
+
+    PARMS:
+        words: array-like of str, the corpus C
+        alphabet: array-like of str, the letters of the alphabet. Column order of the count matrix.
+
+    ATTRIBUTES:
+        counts: (n_words, n_letters) uint8 matrix, counts[w, l] = occurrences of letter l in word w
+        masks: (n_words,) uint32, bit l is set if letter l occurs in word w (26-bit presence mask)
+
+    EXAMPLE:
+        index = CorpusIndex(env.corpus, env.alphabet)
+        words = index.words[index.possible(['w', 'h', 'i', 'c', 'h'])]
+    '''
+    #-----------------------------------------------------------------------------------------------#
+    def __init__(self, words, alphabet, counts=None, masks=None):
+        self.words = np.asarray(words)
+        self.alphabet = np.asarray(alphabet)
+        self.lookup = {l: i for i, l in enumerate(self.alphabet)}
+        assert len(self.alphabet) <= 32, 'Presence masks are 32 bit. Alphabet too large'
+
+        if counts is None:
+            counts, masks = self._encode(self.words)
+        self.counts = counts
+        self.masks = masks
+        self._presence = None
+
+    def __len__(self):
+        return len(self.words)
+
+    def _encode(self, words):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Encode every word as a row of letter counts and a presence bitmask in one pass over a
+        fixed-width byte view of the corpus.
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        n_letters = len(self.alphabet)
+        lut = np.full(256, n_letters, dtype=np.int64)  #unknown bytes fall in a spill column
+        for i, l in enumerate(self.alphabet):
+            lut[ord(l)] = i
+
+        raw = np.asarray(words, dtype='S')
+        counts = np.zeros((len(raw), n_letters), dtype=np.uint8)
+        sizes = np.char.str_len(raw) if len(raw) else np.zeros(0, dtype=np.int64)
+        for width in np.unique(sizes):  #one exact-width byte view per length, no padding to scan
+            rows = np.flatnonzero(sizes == width)
+            if width == 0:
+                continue
+            block = np.ascontiguousarray(raw[rows]).astype('S{}'.format(width))
+            codes = lut[block.view(np.uint8).reshape(len(rows), width)]
+            flat = np.repeat(np.arange(len(rows)), width) * (n_letters + 1) + codes.ravel()
+            block_counts = np.bincount(flat, minlength=len(rows) * (n_letters + 1))
+            counts[rows] = block_counts.reshape(len(rows), n_letters + 1)[:, :n_letters]
+
+        bits = np.left_shift(np.uint32(1), np.arange(n_letters, dtype=np.uint32))
+        masks = ((counts > 0) * bits).sum(axis=1, dtype=np.uint32)
+        return counts, masks
+
+    def letter_counts(self, letters):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Count vector (len(alphabet),) of a hand of letters. Letters outside the alphabet are ignored.
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        vec = np.zeros(len(self.alphabet), dtype=np.int64)
+        for l in letters:
+            i = self.lookup.get(l)
+            if i is not None:
+                vec[i] += 1
+        return vec
+
+    def letter_mask(self, letters):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Presence bitmask of a hand of letters.
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        mask = 0
+        for l in letters:
+            i = self.lookup.get(l)
+            if i is not None:
+                mask |= 1 << i
+        return np.uint32(mask)
+
+    def possible(self, letters, respect_counts=False):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Boolean mask over the corpus of words that can be spelled from letters.
+
+        PARMS:
+            letters: iterable of str (an array of str included), or an integer count vector from
+                     letter_counts
+            respect_counts: bool, if False only letter presence is checked (a repeated letter in a
+                word needs a single copy in the hand). If True the hand must hold every copy.
+        RETURNS:
+            (n_words,) bool array
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        if isinstance(letters, np.ndarray) and letters.dtype.kind in 'iu':
+            assert letters.shape == (len(self.alphabet),), 'Count vector does not match the alphabet'
+            hand = letters
+        else:
+            hand = self.letter_counts(letters)
+
+        if respect_counts:
+            return (self.counts <= hand).all(axis=1)
+        bits = np.left_shift(np.uint32(1), np.arange(len(self.alphabet), dtype=np.uint32))
+        hand_mask = bits[hand > 0].sum(dtype=np.uint32)
+        return (self.masks & ~hand_mask) == 0
+
+    def score(self, hand):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Score every word against a hand in one batched product: the number of letters in the hand
+        (with repeats) that occur somewhere in the word. Higher is closer.
+
+        PARMS:
+            hand: count vector (len(alphabet),) or matrix (n_hands, len(alphabet))
+        RETURNS:
+            (n_words,) or (n_hands, n_words) int array
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        if self._presence is None:
+            self._presence = (self.counts > 0).astype(np.float32)
+        #float32 runs on BLAS, integer matmul does not; scores are small integers, so exact
+        return (np.asarray(hand, dtype=np.float32) @ self._presence.T).astype(np.int32)
+
+    def subset(self, selector):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        New index over a subset of the corpus (bool mask or integer indices). Reuses the encoded rows.
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        return CorpusIndex(self.words[selector], self.alphabet,
+                           counts=self.counts[selector],
+                           masks=self.masks[selector])
+
+
+class RankCache(object):
+    #-----------------------------------------------------------------------------------------------#
+    '''
+    Bounded LRU cache from a hand (letter count vector) to the words of a CorpusIndex closest to it,
+    best first, in the order CorpusIndex.score + first-best argmax would pick them.
+
+    A hand seen for the first time is answered with a plain scan and only remembered; from its second
+    lookup on it gets an entry holding the top depth words still available at that point. Words are
+    only ever claimed, never released, during a game, so an entry stays exact: a lookup skips the
+    words claimed since and returns the first one left, and only rescores once all of them are gone.
+    clear() when the index or the availability mask is rebuilt (a new game).
+
+    PARMS:
+        index: CorpusIndex, the words ranked (env.cand_index)
+        maxsize: int, hands kept
+        depth: int, ranked words kept per hand
+    '''
+    #-----------------------------------------------------------------------------------------------#
+    def __init__(self, index=None, maxsize=4096, depth=32):
+        self.maxsize = maxsize
+        self.depth = depth
+        self.clear(index)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self, index=None):
+        self.index = index
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def cached(self, hand):
+        return self.entries.get(np.asarray(hand, dtype=np.int32).tobytes()) is not None
+
+    def _rank(self, scores, available):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Top depth available words by (score desc, index asc). Scores are small integers, so the words
+        are collected one score level at a time instead of sorting the corpus.
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        scores = np.where(available, scores, -1)
+        top, n = [], 0
+        for level in range(int(scores.max()), -1, -1):
+            words = np.flatnonzero(scores == level)[:self.depth - n]
+            top.append(words)
+            n += len(words)
+            if n == self.depth:
+                break
+        return np.concatenate(top) if top else np.zeros(0, dtype=np.int64)
+
+    def best(self, hand, available, scores=None):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        PARMS:
+            hand: (letters,) count vector
+            available: (words,) bool, words that may still be picked
+            scores: (words,) index.score(hand), if already computed in a batch. Only used on a miss.
+        RETURNS:
+            int, index of the closest available word, -1 if none is available
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        if not available.any():
+            return -1
+        key = np.asarray(hand, dtype=np.int32).tobytes()
+        seen = key in self.entries
+        ranked = self.entries.get(key)
+        if ranked is not None:
+            self.entries.move_to_end(key)
+            left = available[ranked]
+            if left.any():
+                self.hits += 1
+                return int(ranked[left.argmax()])
+
+        self.misses += 1
+        if scores is None:
+            scores = self.index.score(hand)
+        if not seen:
+            #first sighting: a plain argmax is cheaper than ranking, most hands never come back
+            self._insert(key, None)
+            return int(np.argmax(np.where(available, scores, -1)))
+        ranked = self._rank(scores, available)
+        self._insert(key, ranked)
+        return int(ranked[0])
+
+    def _insert(self, key, ranked):
+        self.entries[key] = ranked
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+
+class LookaheadIndex(object):
+    #-----------------------------------------------------------------------------------------------#
+    '''
+    Index over a CorpusIndex answering "which words does one more letter x complete for this hand".
+    A word is complete when the hand holds every copy of its letters.
+
+    For a hand it keeps the (word, letter) pairs of the words the hand lacks exactly one copy of one
+    letter of, in an LRU keyed by the hand's counts. Every word is stored as a bit set of (letter,
+    copy) slots, e.g. 'geese' as g1 e1 e2 e3 s1, packed into uint64 words; a hand holds slot l_t when
+    it has t or more copies of l. A word is one letter short when word & ~hand has a single bit, and
+    the bit names the letter, so a new hand costs a few integer operations over the corpus.
+
+    The pairs of a hand never change. Like RankCache, an entry also keeps the per letter counts
+    over the words available when it was last used, and recounts only after more words were
+    claimed: words are only ever claimed, never released, during a game. Hands recur (neighbors are
+    asked about again and again until they act), so most lookups are a dictionary hit.
+
+    PARMS:
+        index: CorpusIndex, env.cand_index
+        maxsize: int, hands kept
+
+    EXAMPLE:
+        look = LookaheadIndex(env.cand_index)
+        look.unlocks(agent.counts, [0, 4], env.corpus_available)  #words completed by an 'a', by an 'e'
+    '''
+    #-----------------------------------------------------------------------------------------------#
+    def __init__(self, index, maxsize=4096):
+        self.index = index
+        self.maxsize = maxsize
+        counts = np.asarray(index.counts)
+        self.n_letters = counts.shape[1]
+        self.copies = np.arange(1, max(int(counts.max(initial=0)), 1) + 1)
+
+        #words[c, w]: bits 64 c .. 64 c + 63 of the slot bit set of w, bit t * n_letters + l = copy t + 1 of l
+        slots = np.concatenate([counts >= t for t in self.copies], axis=1)
+        slots = np.pad(slots, ((0, 0), (0, -slots.shape[1] % 64))).reshape(len(counts), -1, 64)
+        bits = np.left_shift(np.uint64(1), np.arange(64, dtype=np.uint64))
+        self.words = np.ascontiguousarray((slots * bits).sum(axis=2, dtype=np.uint64).T)
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _near(self, hand):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        (words, letters) arrays, the words one letter short of hand and the letter they lack.
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        held = sum(1 << int(i) for i in np.flatnonzero(np.concatenate([hand >= t for t in self.copies])))
+        lacking = [words & np.uint64(~(held >> 64 * c) & _MASK64) for c, words in enumerate(self.words)]
+        single = np.ones(self.words.shape[1], dtype=bool)
+        short = np.zeros(self.words.shape[1], dtype=np.uint8)
+        for lack in lacking:
+            single &= (lack & (lack - np.uint64(1))) == 0  #at most one bit
+            short += lack != 0
+        w = np.flatnonzero(single & (short == 1))
+        lack = np.stack([lack[w] for lack in lacking])
+        chunk = (lack != 0).argmax(axis=0)
+        bit = lack[chunk, np.arange(len(w))].astype(np.float64)  #a power of two, exact
+        return w, (64 * chunk + np.frexp(bit)[1] - 1) % self.n_letters
+
+    def unlocks_many(self, hands, available):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        PARMS:
+            hands: (hands, letters) count vectors
+            available: (words,) bool, words that count. Only ever loses words during a game.
+        RETURNS:
+            (hands, letters) int array, [i, x] the number of available words that hand i cannot complete
+            now but hand i + x completes
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        hands = np.asarray(hands, dtype=np.int16)
+        claimed = len(available) - np.count_nonzero(available)
+        out = np.empty(hands.shape, dtype=np.int64)
+        for i, hand in enumerate(hands):
+            key = hand.tobytes()
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                entry = self.entries[key] = list(self._near(hand)) + [None, -1]
+                if len(self.entries) > self.maxsize:
+                    self.entries.popitem(last=False)
+            else:
+                self.hits += 1
+                self.entries.move_to_end(key)
+            words, letters, gains, seen = entry
+            if seen != claimed:
+                entry[2] = gains = np.bincount(letters[available[words]], minlength=hands.shape[1])
+                entry[3] = claimed
+            out[i] = gains
+        return out
+
+    def unlocks(self, hand, letters, available):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        PARMS:
+            hand: (letters,) count vector
+            letters: iterable of letter indices, the letters the hand could gain
+            available: (words,) bool, words that count
+        RETURNS:
+            (len(letters),) int array, per letter x the number of available words that the hand cannot
+            complete now but hand + x completes
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        letters = np.asarray(list(letters), dtype=np.int64)
+        return self.unlocks_many([hand], available)[0][letters]
+
+
+def load_alphabet(path='txt/alphabet_english.txt'):
+    #-----------------------------------------------------------------------------------------------#
+    '''
+    Parse the alphabet file once per process. Later calls return the same (read-only) array.
+    '''
+    #-----------------------------------------------------------------------------------------------#
+    key = ('alphabet', os.path.abspath(path), os.path.getmtime(path))
+    if key not in _LOADED:
+        letters = []
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    letters.append(line)
+        alphabet = np.array(letters)
+        alphabet.flags.writeable = False
+        _LOADED[key] = alphabet
+    return _LOADED[key]
+
+
+def _cache_paths(path, alphabet):
+    with open(path, 'rb') as f:
+        digest = hashlib.sha256(f.read())
+    digest.update(''.join(alphabet).encode())
+    stem = os.path.join(os.path.dirname(os.path.abspath(path)), '.cache',
+                        '{}.{}'.format(os.path.basename(path), digest.hexdigest()[:16]))
+    return {name: '{}.{}.npy'.format(stem, name) for name in ('chars', 'offsets', 'counts', 'masks')}
+
+
+def _save_atomic(target, arr):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.npy')
+    with os.fdopen(fd, 'wb') as f:
+        np.save(f, arr)
+    os.replace(tmp, target)  #concurrent builders race harmlessly: same content, atomic rename
+
+
+def _parse_words(path, alphabet):
+    #-----------------------------------------------------------------------------------------------#
+    '''
+    Read a word list as packed bytes: lowercased, words with a character outside the alphabet and
+    repeats dropped, stably sorted by length.
+
+    RETURNS:
+        chars: (total letters,) uint8, every word back to back
+        offsets: (n_words + 1,) int64, word w is chars[offsets[w]:offsets[w + 1]]
+    '''
+    #-----------------------------------------------------------------------------------------------#
+    with open(path, 'rb') as f:
+        words = list(dict.fromkeys(f.read().lower().split()))  #first occurrence of each word
+    sizes = np.fromiter(map(len, words), dtype=np.int64, count=len(words))
+    chars = np.frombuffer(b''.join(words), dtype=np.uint8)
+
+    known = np.zeros(256, dtype=bool)
+    known[[ord(l) for l in alphabet]] = True
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.int64)
+    keep = np.minimum.reduceat(known[chars], starts) if len(words) else np.zeros(0, dtype=bool)
+
+    order = np.flatnonzero(keep)
+    order = order[np.argsort(sizes[order], kind='stable')]
+    chars = np.frombuffer(b''.join(words[i] for i in order), dtype=np.uint8)
+    offsets = np.concatenate([[0], np.cumsum(sizes[order])]).astype(np.int64)
+    return chars, offsets
+
+
+def _unpack_words(chars, offsets):
+    #-----------------------------------------------------------------------------------------------#
+    '''
+    Str array of packed, length-sorted words. Every length is decoded as one fixed-width block.
+    '''
+    #-----------------------------------------------------------------------------------------------#
+    sizes = np.diff(offsets)
+    width = int(sizes.max()) if len(sizes) else 1
+    words = np.empty(len(sizes), dtype='U{}'.format(width))
+    bounds = np.flatnonzero(np.diff(sizes)) + 1
+    for lo, hi in zip(np.concatenate([[0], bounds]), np.concatenate([bounds, [len(sizes)]])):
+        block = np.ascontiguousarray(chars[offsets[lo]:offsets[hi]])
+        words[lo:hi] = block.view('S{}'.format(int(sizes[lo])))
+    return words
+
+
+def load_corpus(path='txt/five_letter_words.txt', alphabet=None):
+    #-----------------------------------------------------------------------------------------------#
+    '''
+    Load a word list as a CorpusIndex backed by a precompiled on-disk artifact.
+
+    Any list of words works: one word per line, any lengths, hundreds of thousands of words. Words are
+    lowercased, words with characters outside the alphabet and repeats are dropped, and the rest are
+    sorted by length (stable, so a list of equal length words keeps its order), so the packed words of
+    one length decode as a single fixed-width block.
+
+    The first load parses the text and writes the words packed back to back (uint8 chars + offsets),
+    the letter count matrix and the presence masks as .npy files under <corpus dir>/.cache/, named by
+    a hash of the source text and the alphabet. Later loads, in this or any other process, memory-map
+    those files read-only instead of parsing, so the pages are shared by every environment and sweep
+    worker on the machine. Editing the word list or the alphabet changes the hash and triggers a rebuild.
+
+    PARMS:
+        path: str, text file with one word per line
+        alphabet: array of letters, defaults to load_alphabet()
+    RETURNS:
+        CorpusIndex, memoized per process
+    '''
+    #-----------------------------------------------------------------------------------------------#
+    alphabet = load_alphabet() if alphabet is None else np.asarray(alphabet)
+    key = ('corpus', os.path.abspath(path), os.path.getmtime(path), tuple(alphabet))
+    if key in _LOADED:
+        return _LOADED[key]
+
+    files = _cache_paths(path, alphabet)
+    if not all(os.path.exists(f) for f in files.values()):
+        os.makedirs(os.path.dirname(files['chars']), exist_ok=True)
+        chars, offsets = _parse_words(path, alphabet)
+        index = CorpusIndex(_unpack_words(chars, offsets), alphabet)
+        _save_atomic(files['chars'], chars)
+        _save_atomic(files['offsets'], offsets)
+        _save_atomic(files['counts'], index.counts)
+        _save_atomic(files['masks'], index.masks)
+
+    words = _unpack_words(np.load(files['chars'], mmap_mode='r'), np.load(files['offsets']))
+    index = CorpusIndex(words, alphabet,
+                        counts=np.load(files['counts'], mmap_mode='r'),
+                        masks=np.load(files['masks'], mmap_mode='r'))
+    _LOADED[key] = index
+    return index
@@ -0,0 +1,491 @@
+import glob
+import json
+import os
+import numpy as np
+
+EVENT_DTYPE = np.dtype([('time', np.int64), ('node', np.int32), ('action', np.int8),
+                        ('letter', np.int8), ('other', np.int32), ('success', np.bool_)])
+
+#-----------------------------------------------------------------------------------------------#
+'''
+Event sinks. The simulation reports one event per action instead of printing:
+
+    time:    env clock when the action was taken
+    node:    acting agent
+    action:  index into env.action_space
+    letter:  letter index in env.alphabet (stolen / passed letter), -1 if none
+    other:   donor (steal) or receiver (pass) node, word index in env.cand_index (form_word), -1 if none
+    success: bool, whether the action changed anything
+    run:     columnar modes only, the game the event belongs to. A directory keeps the events of every
+             environment and reset_env played into it, each game under its own run id.
+
+Pick a sink with environment(..., log=mode):
+    'off'       no-op. Nothing is formatted or stored. Default.
+    'counters'  per-action success / failure counts only
+    'print'     human readable lines on stdout, the old verbose output
+    'jsonl'     one JSON object per event, written to log_path in buffered batches
+    'binary'    packed EVENT_DTYPE records written to log_path in buffered batches, see read_events
+    'npz'       columnar: every batch becomes one compressed chunk file in the directory log_path, every
+                play() appends its environment.summary() as a row of the runs table, and the candidate
+                words form_word's other indexes into are kept per run. See read_columns, read_words.
+    'parquet'   as 'npz' with Parquet chunk files. Needs pyarrow.
+'''
+#-----------------------------------------------------------------------------------------------#
+
+
+class EventSink(object):
+    #-----------------------------------------------------------------------------------------------#
+    '''
+    No-op sink. Base class for the others. Hot paths check sink.enabled before building an event.
+    '''
+    #-----------------------------------------------------------------------------------------------#
+    enabled = False
+
+    def bind(self, env, resume=None):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Attach the sink to env. resume: dict, when continuing a checkpointed game, the position() the
+        output had at the checkpoint. What it held then is kept (anything after it is dropped) and new
+        events are appended. None starts a fresh output.
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        self.env = env
+
+    def position(self):
+        return None
+
+    def event(self, time, node, action, letter=-1, other=-1, success=True):
+        pass
+
+    def events(self, time, node, action, letter, other, success):
+        pass
+
+    def message(self, text):
+        pass
+
+    def reset(self):
+        pass
+
+    def write_run(self, row):
+        pass
+
+    def summary(self):
+        return {}
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+
+class CounterSink(EventSink):
+    #-----------------------------------------------------------------------------------------------#
+    '''
+    Counts events per (action, success). summary() returns e.g. {'steal_letter': 12, 'steal_letter_ok': 9}
+    '''
+    #-----------------------------------------------------------------------------------------------#
+    enabled = True
+
+    def bind(self, env, resume=None):
+        self.env = env
+        self.counts = np.zeros((len(env.action_space), 2), dtype=np.int64)
+
+    def event(self, time, node, action, letter=-1, other=-1, success=True):
+        self.counts[action, int(success)] += 1
+
+    def reset(self):
+        self.counts[:] = 0
+
+    def events(self, time, node, action, letter, other, success):
+        np.add.at(self.counts, (np.asarray(action, dtype=np.int64),
+                                np.asarray(success, dtype=np.int64)), 1)
+
+    def summary(self):
+        out = {}
+        for i, name in enumerate(self.env.action_space):
+            out[name] = int(self.counts[i].sum())
+            out[name + '_ok'] = int(self.counts[i, 1])
+        return out
+
+
+class PrintSink(CounterSink):
+    #-----------------------------------------------------------------------------------------------#
+    '''
+    Prints every event and message to stdout. For interactive runs on small graphs.
+    '''
+    #-----------------------------------------------------------------------------------------------#
+    outcomes = {
+        'form_word': ('word formed: {word}', 'unable to form word. Need additional letters.'),
+        'steal_letter': ('letter {letter} successfully stolen from node {other}',
+                         'unable to steal the chosen letter from k-hop neighbors'),
+        'pass_letter': ('letter {letter} successfully passed to node {other}',
+                        'unable to pass the chosen letter to k-hop neighbors'),
+        'think': ('', ''),
+    }
+
+    def event(self, time, node, action, letter=-1, other=-1, success=True):
+        CounterSink.event(self, time, node, action, letter, other, success)
+        name = self.env.action_space[action]
+        print('-' * 50)
+        print('action to node: {} , Env Clock: {}'.format(node, time))
+        print('taking action: {}'.format(name.replace('_', ' ')))
+        word = self.env.cand_index.words[other] if name == 'form_word' and other >= 0 else None
+        line = self.outcomes[name][0 if success else 1].format(
+            letter=self.env.alphabet[letter] if letter >= 0 else None, other=other, word=word)
+        if line:
+            print(line)
+
+    def events(self, time, node, action, letter, other, success):
+        for row in zip(time, node, action, letter, other, success):
+            self.event(*[int(v) for v in row])
+
+    def message(self, text):
+        print(text)
+
+
+class BufferedSink(CounterSink):
+    #-----------------------------------------------------------------------------------------------#
+    '''
+    Collects events into a packed EVENT_DTYPE buffer and hands full batches to write_batch.
+
+    PARMS:
+        path: str, output file. Truncated on bind, or cut back to the checkpoint's events on a resume.
+        batch_size: int, events held in memory before a write
+
+    written counts the events handed to the output so far, the position() a checkpoint resumes from.
+    '''
+    #-----------------------------------------------------------------------------------------------#
+    def __init__(self, path, batch_size=65536):
+        self.path = path
+        self.batch_size = batch_size
+        self.buffer = np.zeros(batch_size, dtype=EVENT_DTYPE)
+        self.n = 0
+        self.written = 0
+        self.file = None
+
+    def bind(self, env, resume=None):
+        CounterSink.bind(self, env)
+        if resume is None:
+            self.file = open(self.path, self.mode)
+        else:
+            if os.path.exists(self.path):
+                self.truncate(resume['events'])
+            self.file = open(self.path, self.mode.replace('w', 'a'))
+        self.written = resume['events'] if resume else 0
+
+    def position(self):
+        return {'events': self.written}
+
+    def event(self, time, node, action, letter=-1, other=-1, success=True):
+        CounterSink.event(self, time, node, action, letter, other, success)
+        if self.n == self.batch_size:
+            self.flush()
+        self.buffer[self.n] = (time, node, action, letter, other, success)
+        self.n += 1
+
+    def events(self, time, node, action, letter, other, success):
+        CounterSink.events(self, time, node, action, letter, other, success)
+        cols = np.broadcast_arrays(time, node, action, letter, other, success)
+        for lo in range(0, cols[0].size, self.batch_size):
+            k = min(self.batch_size, cols[0].size - lo)
+            if self.n + k > self.batch_size:
+                self.flush()
+            block = self.buffer[self.n:self.n + k]
+            for name, col in zip(EVENT_DTYPE.names, cols):
+                block[name] = col[lo:lo + k]
+            self.n += k
+
+    def flush(self):
+        if self.file is not None and self.n:
+            self.write_batch(self.buffer[:self.n])
+            self.file.flush()
+            self.written += self.n
+        self.n = 0
+
+    def close(self):
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class BinarySink(BufferedSink):
+    mode = 'wb'
+
+    def truncate(self, n_events):
+        if os.path.getsize(self.path) > n_events * EVENT_DTYPE.itemsize:
+            os.truncate(self.path, n_events * EVENT_DTYPE.itemsize)
+
+    def write_batch(self, batch):
+        batch.tofile(self.file)
+
+
+class JsonlSink(BufferedSink):
+    mode = 'w'
+
+    def truncate(self, n_events):
+        with open(self.path, 'rb+') as f:
+            for _ in range(n_events):
+                if not f.readline():
+                    return
+            f.truncate()
+
+    def write_batch(self, batch):
+        actions = self.env.action_space
+        alphabet = self.env.alphabet
+        lines = [
+            json.dumps({'time': int(t), 'node': int(n), 'action': actions[a],
+                        'letter': str(alphabet[l]) if l >= 0 else None,
+                        'other': int(o), 'success': bool(s)})
+            for t, n, a, l, o, s in batch.tolist()
+        ]
+        self.file.write('\n'.join(lines) + '\n')
+
+
+class ChunkWriter(object):
+    #-----------------------------------------------------------------------------------------------#
+    '''
+    Writes column batches to numbered chunk files <directory>/<prefix>-<k>.<fmt>, so a table grows by
+    appending files and never has to be held in memory, and a reader can load single columns.
+
+    PARMS:
+        directory: str, created if missing
+        prefix: str, table name, e.g. 'events' or 'runs'
+        fmt: str, 'npz' (np.savez_compressed, one array per column) or 'parquet' (needs pyarrow)
+    '''
+    #-----------------------------------------------------------------------------------------------#
+    def __init__(self, directory, prefix, fmt='npz'):
+        assert fmt in ('npz', 'parquet'), 'Unknown chunk format {}'.format(fmt)
+        if fmt == 'parquet':
+            import pyarrow  #fail at bind time, not at the first flush
+        self.directory, self.prefix, self.fmt = directory, prefix, fmt
+        os.makedirs(directory, exist_ok=True)
+        self.n_chunks = len(_chunk_files(directory, prefix))
+
+    def clear(self):
+        for f in _chunk_files(self.directory, self.prefix):
+            os.remove(f)
+        self.n_chunks = 0
+
+    def write(self, columns):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Append one chunk. columns: dict, column name -> 1d array, all of the same length.
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        path = os.path.join(self.directory, '{}-{:06d}.{}'.format(self.prefix, self.n_chunks, self.fmt))
+        _save_chunk(path, columns)
+        self.n_chunks += 1
+
+    def truncate(self, rows):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Keep the first rows rows of the table: later chunks are removed, the chunk holding the cut rewritten.
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        kept = 0
+        for f in _chunk_files(self.directory, self.prefix):
+            columns = _load_chunk(f)
+            n = len(next(iter(columns.values()))) if columns else 0
+            if kept >= rows:
+                os.remove(f)
+            elif kept + n > rows:
+                _save_chunk(f, {k: v[:rows - kept] for k, v in columns.items()})
+            kept += n
+        self.n_chunks = len(_chunk_files(self.directory, self.prefix))
+
+    def flush(self):
+        pass  #every chunk is complete on disk once written
+
+    def close(self):
+        pass
+
+
+def _save_chunk(path, columns):
+    if path.endswith('.npz'):
+        np.savez_compressed(path, **columns)
+    else:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        pq.write_table(pa.table({k: np.asarray(v) for k, v in columns.items()}), path)
+
+
+def _load_chunk(path):
+    if path.endswith('.npz'):
+        with np.load(path) as data:
+            return {name: data[name] for name in data.files}
+    import pyarrow.parquet as pq
+    t = pq.read_table(path)
+    return {name: t.column(name).to_numpy() for name in t.column_names}
+
+
+def _chunk_files(directory, prefix):
+    return sorted(glob.glob(os.path.join(directory, prefix + '-[0-9]*.npz')) +
+                  glob.glob(os.path.join(directory, prefix + '-[0-9]*.parquet')))
+
+
+class ColumnarSink(BufferedSink):
+    #-----------------------------------------------------------------------------------------------#
+    '''
+    Streams events to the 'events' table and per-run aggregates to the 'runs' table of a chunked
+    columnar directory (see ChunkWriter), both with a run column. At most batch_size events are held
+    in memory. meta.json holds the action_space and alphabet that the integer action / letter columns
+    index into, and the 'words' table the candidate words of each run (see read_words).
+
+    A new sink continues after the highest run id in the directory, and every reset_env that follows
+    logged events starts the next run.
+
+    PARMS:
+        path: str, output directory. Earlier tables in it are kept. On a resume they are cut back to
+              their rows at the checkpoint.
+        batch_size: int, events per chunk
+        fmt: str, 'npz' or 'parquet'
+    '''
+    #-----------------------------------------------------------------------------------------------#
+    def __init__(self, path, batch_size=65536, fmt='npz'):
+        BufferedSink.__init__(self, path, batch_size)
+        self.fmt = fmt
+        self.run = 0
+        self.run_start = 0  #written at the start of the run
+        self.words_run = None  #run whose candidate words are on disk
+
+    def bind(self, env, resume=None):
+        CounterSink.bind(self, env)
+        self.file = ChunkWriter(self.path, 'events', self.fmt)
+        self.runs = ChunkWriter(self.path, 'runs', self.fmt)
+        runs = {int(f.rsplit('-', 1)[1].split('.')[0]): f for f in _chunk_files(self.path, 'words')}
+        if resume is None:
+            self.written = self.file_rows()
+            self.run = max(runs) + 1 if runs else 0
+        else:
+            self.file.truncate(resume['events'])
+            self.runs.truncate(resume['runs'])
+            for run in runs:
+                if run > resume['run']:  #started after the checkpoint
+                    os.remove(runs[run])
+            self.written, self.run = resume['events'], resume['run']
+        self.run_start, self.words_run = self.written, None
+        with open(os.path.join(self.path, 'meta.json'), 'w') as f:
+            json.dump({'action_space': list(env.action_space), 'alphabet': [str(l) for l in env.alphabet],
+                       'format': self.fmt}, f)
+
+    def file_rows(self):
+        files = _chunk_files(self.path, 'events')
+        return len(read_columns(self.path, columns=['run'])['run']) if files else 0
+
+    def position(self):
+        return {'events': self.written, 'runs': self.runs.n_chunks, 'run': self.run}
+
+    def reset(self):
+        self.flush()  #buffered events belong to the run that ends here
+        CounterSink.reset(self)
+        if self.written > self.run_start or self.words_run == self.run:
+            self.run += 1
+        self.run_start = self.written
+
+    def write_words(self):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Save env.corpus_possible, the words form_word events index, once per run as words-<run>.<fmt>.
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        if self.words_run != self.run:
+            words = np.array(self.env.corpus_possible, dtype=str)
+            _save_chunk(os.path.join(self.path, 'words-{:06d}.{}'.format(self.run, self.fmt)),
+                        {'run': np.full(len(words), self.run, dtype=np.int32), 'word': words})
+            self.words_run = self.run
+
+    def write_batch(self, batch):
+        self.write_words()
+        columns = {'run': np.full(len(batch), self.run, dtype=np.int32)}
+        columns.update((name, batch[name]) for name in EVENT_DTYPE.names)
+        self.file.write(columns)
+
+    def write_run(self, row):
+        self.flush()
+        self.write_words()
+        row = dict({'run': self.run}, **row)
+        self.runs.write({k: np.array([v]) for k, v in row.items()})
+
+
+def read_columns(path, table='events', columns=None):
+    #-----------------------------------------------------------------------------------------------#
+    '''
+    Load a table written by ColumnarSink (or any ChunkWriter) from the directory path.
+
+    PARMS:
+        table: str, 'events', 'runs' or 'words'
+        columns: list of str, the columns to load. Other columns are never read. None for all.
+    RETURNS:
+        dict, column name -> array, concatenated over the chunks in order. Raises ValueError if a
+        chunk lacks a column the others have, rather than returning misaligned columns.
+    '''
+    #-----------------------------------------------------------------------------------------------#
+    parts, names = {}, None
+    for f in _chunk_files(path, table):
+        if f.endswith('.npz'):
+            with np.load(f) as data:
+                found = set(data.files)
+                wanted = data.files if columns is None else columns
+                missing = set(wanted) - found
+                chunk = {name: data[name] for name in wanted if name in found}
+        else:
+            import pyarrow.parquet as pq
+            schema = pq.read_schema(f)
+            found = set(schema.names)
+            missing = set(schema.names if columns is None else columns) - found
+            t = pq.read_table(f, columns=[c for c in (columns or schema.names) if c in found])
+            chunk = {name: t.column(name).to_numpy() for name in t.column_names}
+        if names is None:
+            names = set(chunk)
+        missing |= names ^ set(chunk)
+        if missing:  #concatenating the rest would shift rows between columns
+            raise ValueError('Chunk {} does not have the columns of the table: {}'.format(
+                f, ', '.join(sorted(missing))))
+        for name, values in chunk.items():
+            parts.setdefault(name, []).append(values)
+    return {name: np.concatenate(p) for name, p in parts.items()}
+
+
+def read_words(path, run):
+    #-----------------------------------------------------------------------------------------------#
+    '''
+    RETURNS: array of str, the candidate words of run in a ColumnarSink directory. The other column of
+    its form_word events indexes into it.
+    '''
+    #-----------------------------------------------------------------------------------------------#
+    with open(os.path.join(path, 'meta.json')) as f:
+        fmt = json.load(f)['format']
+    return _load_chunk(os.path.join(path, 'words-{:06d}.{}'.format(run, fmt)))['word']
+
+
+def make_sink(mode='off', path=None, batch_size=65536):
+    #-----------------------------------------------------------------------------------------------#
+    '''
+    Build the event sink for a log mode (see module docstring).
+    '''
+    #-----------------------------------------------------------------------------------------------#
+    if mode == 'off':
+        return EventSink()
+    if mode == 'counters':
+        return CounterSink()
+    if mode == 'print':
+        return PrintSink()
+    assert path is not None, 'log mode {} needs a log_path'.format(mode)
+    if mode == 'jsonl':
+        return JsonlSink(path, batch_size)
+    if mode == 'binary':
+        return BinarySink(path, batch_size)
+    if mode in ('npz', 'parquet'):
+        return ColumnarSink(path, batch_size, fmt=mode)
+    raise ValueError('Unknown log mode {}'.format(mode))
+
+
+def read_events(path):
+    #-----------------------------------------------------------------------------------------------#
+    '''
+    Load a log written by BinarySink as an EVENT_DTYPE record array.
+    '''
+    #-----------------------------------------------------------------------------------------------#
+    return np.fromfile(path, dtype=EVENT_DTYPE)
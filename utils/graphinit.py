@@ -1,13 +1,67 @@
 #imports
 import networkx as nx
-import matplotlib.pyplot as plt
 import numpy as np
-from numpy import dot
 from numpy.linalg import norm
-import pandas as pd
 
+STRATEGIES = ['selfish', 'altruistic']  #strategy types, in label order
 
 
+def sparse_gnp_edges(num_nodes, prob_edges, rng):
+    '''
+    Sample the edge list of a G(n,p) graph in O(n + m) with geometric skipping (Batagelj & Brandes):
+    instead of flipping a coin for each of the n(n-1)/2 pairs, draw the gaps between successive
+    edges in the pair enumeration (1,0), (2,0), (2,1), (3,0), ...
+
+    PARMS:
+        num_nodes: int
+        prob_edges: float, [0,1.]
+        rng: np.random.Generator
+    RETURNS:
+        (m, 2) int64 array of edges (u, v) with u > v
+    '''
+    n_pairs = num_nodes * (num_nodes - 1) // 2
+    if prob_edges <= 0 or n_pairs == 0:
+        return np.zeros((0, 2), dtype=np.int64)
+    if prob_edges >= 1:
+        idx = np.arange(n_pairs, dtype=np.int64)
+    else:
+        chunks, last = [], -1
+        chunk = int(n_pairs * prob_edges * 1.05) + 64
+        while last < n_pairs:
+            pos = last + np.cumsum(rng.geometric(prob_edges, chunk).astype(np.int64))
+            chunks.append(pos)
+            last = pos[-1]
+        idx = np.concatenate(chunks)
+        idx = idx[idx < n_pairs]
+
+    #invert idx = u(u-1)/2 + v, v < u
+    u = ((1 + np.sqrt(1 + 8 * idx.astype(np.float64))) // 2).astype(np.int64)
+    u -= (u * (u - 1) // 2) > idx  #guard against float rounding
+    u += ((u + 1) * u // 2) <= idx
+    v = idx - u * (u - 1) // 2
+    return np.stack([u, v], axis=1)
+
+
+def random_tree_edges(num_nodes, rng):
+    '''
+    Edges of a uniformly labelled random recursive tree: nodes are visited in random order and each
+    attaches to a uniformly chosen node visited before it.
+    '''
+    order = rng.permutation(num_nodes)
+    parent = order[(rng.random(num_nodes - 1) * np.arange(1, num_nodes)).astype(np.int64)]
+    return np.stack([order[1:], parent], axis=1)
+
+
+def stitch_components(G, rng):
+    '''
+    Connect a disjoint graph by chaining its components, in random order, through one random node
+    of each. Adds (number of components - 1) edges.
+    '''
+    reps = [rng.choice(list(c)) for c in nx.connected_components(G)]
+    reps = [reps[i] for i in rng.permutation(len(reps))]
+    G.add_edges_from(zip(reps[:-1], reps[1:]))
+    return G
+
 
 class Network():
     #-----------------------------------------------------------------------------------------------#
@@ -18,6 +72,15 @@ class Network():
         prob_edges: float (0,1], Bounded probabiltiy for edge creation in random graph.
         pr_selfish: float (0,1], Bounded probability determining distribution of player strategy types.
         p_star: float [0,1]
+        seed: int or np.random.SeedSequence, seeds the graph and strategy draws. Random if None.
+        topology: str, 'gnp' (Erdos-Renyi G(n, prob_edges)), 'small_world' (Watts-Strogatz ring of
+                  degree k, rewired with prob_edges) or 'scale_free' (Barabasi-Albert, k // 2 edges
+                  per new node)
+        connect: str, how a gnp graph is made connected. 'resample' draws again until connected.
+                 'stitch' chains the components of one draw together. 'tree' lays a random
+                 spanning tree under the G(n,p) edges. Use 'stitch' or 'tree' for large sparse graphs,
+                 where resampling may practically never succeed.
+        k: int, mean degree parameter of the small_world / scale_free topologies
 
     RETURNS:
         Graph with node attributes set
@@ -44,12 +107,23 @@ class Network():
                     4   v4  altruistic  [0.1, 0.2, 0.4, 0.3]  [0, 1, 2, 3]      4
     '''
     #-----------------------------------------------------------------------------------------------#
-    def __init__(self, num_nodes, prob_edges, pr_selfish, p_star):
+    def __init__(self, num_nodes, prob_edges, pr_selfish, p_star, seed=None, topology='gnp',
+                 connect='resample', k=4):
+        assert topology in ('gnp', 'small_world', 'scale_free'), 'Unknown topology {}'.format(topology)
+        assert connect in ('resample', 'stitch', 'tree'), 'Unknown connect mode {}'.format(connect)
 
         self.num_nodes = num_nodes
         self.prob_edges = prob_edges
         self.pr_selfish = pr_selfish
         self.p_star = p_star
+        self.rng = np.random.default_rng(seed)
+        self.strategies = list(STRATEGIES)
+        self.labels = None  #strategy index per node, set by set_node_atts
+        self.edges = None
+        self.edge_weights = None
+        self.topology = topology
+        self.connect = connect
+        self.k = k
         self.p_act = {
             'selfish':
             np.round([p_star / 2, 2 * p_star, p_star, 1 - 3.5 * p_star], 2),
@@ -68,14 +142,11 @@ class Network():
         assert self.pr_selfish <= 1. and self.pr_selfish >= 0., 'Invalid probability. pr_selfish must be [0.,1.]'
 
         #Randomly assign strategy profiles according to predfined probabiltiy pr_selfish
-        #Append node attributes as a dictionary of randomly chosen strat types per |V|
-        label = np.random.choice(list(self.p_act.keys()), self.num_nodes,
-                                 self.pr_selfish)
-        labels = {}
-        for i, j in enumerate(label):
-            labels[i] = j, self.p_act[j]
-
-        nx.set_node_attributes(G, labels, 'atts')
+        #labels[i] indexes self.strategies: 0 selfish, 1 altruistic
+        n = G.number_of_nodes()
+        self.labels = (self.rng.random(n) >= self.pr_selfish).astype(np.int8)
+        atts = [(s, self.p_act[s]) for s in self.strategies]
+        nx.set_node_attributes(G, {i: atts[l] for i, l in enumerate(self.labels.tolist())}, 'atts')
 
         return G
 
@@ -86,16 +157,47 @@ class Network():
         Returns:
             G: A weighted graph with edge weights determined via similarity between node strategy vectors
 
+        There are only two strategy vectors, so the cosine similarity of every pair of strategies is
+        computed once and edges look their weight up by the labels of their endpoints. The edge list
+        and weights are also kept off-graph in self.edges / self.edge_weights.
         '''
-        for i in G.edges():
-            a = np.round(G.nodes[i[0]]['atts'][1], 2)
-            b = np.round(G.nodes[i[1]]['atts'][1], 2)
-            #Compute Cos Similarity
-            sim = np.round(np.dot(a, b) / (norm(a) * norm(b)),
-                           2)  #Round for visualization of edge weights
-            G[i[0]][i[1]]['weight'] = sim
+        if self.labels is None or len(self.labels) != G.number_of_nodes():
+            self.labels = np.array([self.strategies.index(G.nodes[i]['atts'][0]) for i in G.nodes],
+                                   dtype=np.int8)
+
+        #Compute Cos Similarity between strategy vectors. Round for visualization of edge weights
+        p = np.round(np.stack([self.p_act[s] for s in self.strategies]), 2)
+        sims = np.round(p @ p.T / np.outer(norm(p, axis=1), norm(p, axis=1)), 2)
+
+        self.edges = np.array(G.edges(), dtype=np.int64).reshape(-1, 2)
+        self.edge_weights = sims[self.labels[self.edges[:, 0]], self.labels[self.edges[:, 1]]]
+        nx.set_edge_attributes(G, dict(zip(map(tuple, self.edges.tolist()),
+                                           self.edge_weights.tolist())), 'weight')
         return G
 
+    def make_graph(self):
+        '''
+        RETURNS:
+            A connected graph on nodes 0..num_nodes-1 with the configured topology, no attributes set.
+        '''
+        seed = int(self.rng.integers(2**32))
+        if self.topology == 'small_world':
+            return nx.connected_watts_strogatz_graph(self.num_nodes, self.k, self.prob_edges,
+                                                     seed=seed)
+        if self.topology == 'scale_free':
+            return nx.barabasi_albert_graph(self.num_nodes, max(self.k // 2, 1), seed=seed)
+
+        while True:
+            G = nx.Graph()
+            G.add_nodes_from(range(self.num_nodes))
+            G.add_edges_from(sparse_gnp_edges(self.num_nodes, self.prob_edges, self.rng).tolist())
+            if self.connect == 'tree':
+                G.add_edges_from(random_tree_edges(self.num_nodes, self.rng).tolist())
+            if self.connect == 'stitch':
+                G = stitch_components(G, self.rng)
+            if nx.is_connected(G):
+                return G
+
     #Don't want disjoint commununities.
     #All edges must have a degree >= 1
     def make_random_graph(self, plot=True, print_table=True):
@@ -111,41 +213,58 @@ class Network():
 
         '''
         assert self.prob_edges <= 1. and self.prob_edges >= 0., 'Invalid edge probability. prob_edges must be [0.,1.]'
-        connected = False
-        while not connected:
-            G = nx.gnp_random_graph(self.num_nodes, self.prob_edges)
-            connected = nx.is_connected(G)
+        G = self.make_graph()
 
         assert len(list(nx.connected_components(G))) == 1, 'Graph is Disjoint'
 
         G = self.set_node_atts(G)
         G = self.set_edge_weights(G)
 
-        if print_table:
-            test = {}
-            for i, j in enumerate(G.nodes):
-                test[i] = ('v{}'.format(i), G.nodes[i]['atts'][0],
-                           G.nodes[i]['atts'][1], [j for j in G.neighbors(i)],
-                           G.degree(i))
-
-            cols = ['node', 'strat', 'p_act', 'neighbors', 'degree']
-            df = pd.DataFrame.from_dict(test).T
-            df.columns = cols
-            print(df)
-
+        test = self.node_table(G) if print_table else None
         if plot:
-            color_map = []
-            for i in G:
-                if G.nodes[i]['atts'][0] == 'selfish':
-                    color_map.append('red')
-                else:
-                    color_map.append('green')
-            pos = nx.spring_layout(G, k=0.5, iterations=100)
-            plt.figure(3, figsize=(10, 5))
-            nx.draw(G, pos, node_color=color_map)
-            nx.draw_networkx_labels(G, pos)
-            nx.draw_networkx_edge_labels(G, pos, font_size=7)
-            plt.grid()
-            plt.axis(True)
-            plt.show()
+            self.plot_graph(G)
         return G, test
+
+    def node_table(self, G):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Print a node / strategy / p_act / neighbors / degree table. pandas is only imported here.
+
+        RETURNS:
+            dict, node -> the printed row
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        import pandas as pd
+        test = {}
+        for i, j in enumerate(G.nodes):
+            test[i] = ('v{}'.format(i), G.nodes[i]['atts'][0],
+                       G.nodes[i]['atts'][1], [j for j in G.neighbors(i)],
+                       G.degree(i))
+
+        cols = ['node', 'strat', 'p_act', 'neighbors', 'degree']
+        df = pd.DataFrame.from_dict(test).T
+        df.columns = cols
+        print(df)
+        return test
+
+    def plot_graph(self, G):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Draw the graph, selfish nodes red and altruistic green. matplotlib is only imported here.
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        import matplotlib.pyplot as plt
+        color_map = []
+        for i in G:
+            if G.nodes[i]['atts'][0] == 'selfish':
+                color_map.append('red')
+            else:
+                color_map.append('green')
+        pos = nx.spring_layout(G, k=0.5, iterations=100)
+        plt.figure(3, figsize=(10, 5))
+        nx.draw(G, pos, node_color=color_map)
+        nx.draw_networkx_labels(G, pos)
+        nx.draw_networkx_edge_labels(G, pos, font_size=7)
+        plt.grid()
+        plt.axis(True)
+        plt.show()
@@ -1,5 +1,7 @@
 import numpy as np
+import itertools
 from collections import Counter
+from utils.corpus import CorpusIndex, load_alphabet
 
 def get_english_alphabet(file='txt/alphabet_english.txt'):
     '''
@@ -9,10 +11,10 @@ def get_english_alphabet(file='txt/alphabet_english.txt'):
 
     Returns
     __________
-    Numpy array containing all letters of the alphabet
+    Numpy array containing all letters of the alphabet. Parsed once per process.
 
     '''
-    return np.loadtxt(file, dtype='str')  ##load text file containing english alphabet
+    return load_alphabet(file)  ##load text file containing english alphabet
 
 def charCount(word):
     dict = {}
@@ -20,42 +22,88 @@ def charCount(word):
         dict[i] = dict.get(i, 0) + 1
     return dict
 
-def possible_words(lwords, charSet):
-    pos_words = []
-    for word in lwords:
-        flag = 1
-        chars = charCount(word)
-        for key in chars:
-            if key not in charSet:
-                flag = 0
-#             else:
-#                 if charSet.count(key) != chars[key]:
-#                     flag = 0
-        if flag == 1:
-            pos_words.append(word)
-    return pos_words
+def possible_words(lwords, charSet, index=None):
+    '''
+    Parameters
+    __________
+    lwords: list of str, the corpus to filter
+    charSet: list of str, the pooled letters available
+    index: CorpusIndex, optional. Prebuilt index over lwords. Built on the fly if not given.
+
+    Returns
+    __________
+    List of words in lwords whose letters all appear in charSet. Only letter presence is checked,
+    not letter counts.
+
+    '''
+    if index is None:
+        alphabet = sorted(set(charSet) | set(itertools.chain.from_iterable(lwords)))
+        index = CorpusIndex(lwords, alphabet)
+    return list(index.words[index.possible(charSet)])
 
 def hamming_distance(string1, string2):
     '''
     Parameters
     __________
     string1: dtype str
-    string1: dtype str
+    string2: dtype str, may differ in length from string1
 
     Returns
     __________
     Computes and returns the Hamming distance between a target word and a current set of characters contained within the
     english alphabet.
     Used to determine how far an agent is far the target word and drives their decision making process at each timestep.
+    Positions past the end of the shorter string count as differences, so words of unequal length compare as
+    the distance over the common prefix plus the difference in length.
 
     '''
 
-    # Start with a distance of zero, and count up
-    distance = 0
-    L = len(string1)
+    # Start with the letters one string has beyond the other, and count up
+    L = min(len(string1), len(string2))
+    distance = max(len(string1), len(string2)) - L
     for i in range(L):
         # Add 1 to the distance if these two characters are not equal
         if string1[i] != string2[i]:
             distance += 1
     # Return the final count of differences
     return distance
+
+def csr_adjacency(G):
+    '''
+    Parameters
+    __________
+    G: nx graph with nodes labelled 0..|V|-1
+
+    Returns
+    __________
+    indptr, indices: int arrays. Compressed sparse row adjacency. The neighbors of node i are
+    indices[indptr[i]:indptr[i+1]], sorted ascending.
+
+    '''
+    n = G.number_of_nodes()
+    edges = np.array(G.edges(), dtype=np.int64).reshape(-1, 2)
+    src = np.concatenate([edges[:, 0], edges[:, 1]])
+    dst = np.concatenate([edges[:, 1], edges[:, 0]])
+    order = np.lexsort((dst, src))
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=n), out=indptr[1:])
+    return indptr, dst[order]
+
+def csr_gather(indptr, indices, rows):
+    '''
+    Parameters
+    __________
+    indptr, indices: CSR adjacency from csr_adjacency
+    rows: int array of nodes
+
+    Returns
+    __________
+    seg, nbrs: int arrays of equal length. nbrs lists the neighbors of every node in rows back to back
+    (in row order) and seg[k] is the position in rows that nbrs[k] belongs to.
+
+    '''
+    starts = indptr[rows]
+    lens = indptr[rows + 1] - starts
+    seg = np.repeat(np.arange(len(rows)), lens)
+    offsets = np.arange(lens.sum()) - np.repeat(np.cumsum(lens) - lens, lens)
+    return seg, indices[np.repeat(starts, lens) + offsets]
@@ -0,0 +1,112 @@
+import numpy as np
+
+SLOTS = ['letters_initial', 'letters_stolen', 'letters_received']  #agent.letters keys, by slot index
+
+EVENT_DTYPE = np.dtype([('time', np.int64), ('node', np.int32), ('slot', np.int8),
+                        ('letter', np.int8), ('delta', np.int16)])
+
+
+class StateHistory(object):
+    #-----------------------------------------------------------------------------------------------#
+    '''
+    Delta-encoded store of the letter state of every agent over time.
+
+    Every change to a hand is appended as one event (time, node, slot, letter, delta) to a compact
+    growable record array. Full snapshots (keyframes) of the (agents, 3, letters) count state are taken
+    once enough events have piled up since the last one, so memory stays linear in events and any
+    past state is rebuilt from the nearest keyframe plus a bounded number of events.
+
+    PARMS:
+        n_agents: int
+        n_letters: int, alphabet size
+        keyframe_every: int, events between keyframes. Defaults to the size of one snapshot, which
+                        keeps keyframes from ever outweighing the event log.
+
+    EXAMPLE:
+        hist = env.historical_states
+        state = hist.state_at(120)      #(agents, 3, letters) counts after every event at t <= 120
+        state[4, 1]                     #letter counts stolen by agent 4 so far
+    '''
+    #-----------------------------------------------------------------------------------------------#
+    def __init__(self, n_agents, n_letters, keyframe_every=None):
+        self.shape = (n_agents, len(SLOTS), n_letters)
+        self.keyframe_every = keyframe_every or int(np.prod(self.shape))
+        self.events = np.zeros(1024, dtype=EVENT_DTYPE)
+        self.n_events = 0
+        self.keyframe_times = [0]
+        self.keyframe_events = [0]  #number of events already folded into each keyframe
+        self.keyframes = [np.zeros(self.shape, dtype=np.int16)]
+
+    def __len__(self):
+        return self.n_events
+
+    @property
+    def nbytes(self):
+        return self.events[:self.n_events].nbytes + sum(k.nbytes for k in self.keyframes)
+
+    def _reserve(self, n):
+        if self.n_events + n > len(self.events):
+            grown = np.zeros(max(2 * len(self.events), self.n_events + n), dtype=EVENT_DTYPE)
+            grown[:self.n_events] = self.events[:self.n_events]
+            self.events = grown
+
+    def record(self, time, node, slot, letter, delta=1):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Append one event. Times must be non-decreasing across calls.
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        self._reserve(1)
+        self.events[self.n_events] = (time, node, slot, letter, delta)
+        self.n_events += 1
+
+    def record_batch(self, time, node, slot, letter, delta=1):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Append many events at once. Every argument is a scalar or an array of a common length.
+        Events within the batch are stored in time order.
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        cols = np.broadcast_arrays(time, node, slot, letter, delta)
+        n = cols[0].size
+        if n == 0:
+            return
+        self._reserve(n)
+        order = np.argsort(cols[0].ravel(), kind='stable')
+        block = self.events[self.n_events:self.n_events + n]
+        for name, col in zip(EVENT_DTYPE.names, cols):
+            block[name] = col.ravel()[order]
+        self.n_events += n
+
+    def keyframe(self, time, state):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Snapshot the full (agents, 3, letters) count state. Must reflect every event recorded so far.
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        self.keyframe_times.append(time)
+        self.keyframe_events.append(self.n_events)
+        self.keyframes.append(np.array(state, dtype=np.int16).reshape(self.shape))
+
+    def maybe_keyframe(self, time, state_fn):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Take a keyframe if keyframe_every events have accumulated. state_fn is only called when due.
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        if self.n_events - self.keyframe_events[-1] >= self.keyframe_every:
+            self.keyframe(time, state_fn())
+
+    def state_at(self, t):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Rebuild the (agents, 3, letters) count state after every event with time <= t.
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        events = self.events[:self.n_events]
+        n = np.searchsorted(events['time'], t, side='right')
+        k = np.searchsorted(self.keyframe_events, n, side='right') - 1
+        state = self.keyframes[k].astype(np.int32)
+        tail = events[self.keyframe_events[k]:n]
+        np.add.at(state, (tail['node'], tail['slot'], tail['letter']), tail['delta'])
+        return state
@@ -0,0 +1,280 @@
+import json
+import os
+import resource
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+
+HEADER_DTYPE = np.dtype([('seq', np.uint64), ('slots', np.uint32), ('slot_bytes', np.uint32)])
+
+#-----------------------------------------------------------------------------------------------#
+'''
+Live metrics of a running game. The simulation loop publishes a small JSON snapshot every few seconds
+of wall time into a ring buffer in shared memory; any process can attach to the ring by name and
+read the latest snapshots without ever blocking the writer, and an optional HTTP endpoint serves the
+same snapshots from a background thread.
+
+Snapshot fields:
+    seq                     1, 2, ... in publication order
+    time, time_max          clock ticks played / allowed
+    wall                    seconds since play() started
+    steps_per_s             ticks per second since the previous snapshot
+    steps_per_s_mean        ticks per second since play() started
+    words_formed            words formed so far, and words_<strategy> per strategy type
+    steal_success, pass_success
+                            success rates of steal_letter / pass_letter so far. Need an event sink
+                            other than 'off' or profile=True, None otherwise
+    rss_mb, peak_rss_mb     resident memory of the simulating process, now and at its peak
+    done                    True on the last snapshot of a play() call
+
+EXAMPLE:
+    env = environment(G, t_max=10**7, engine='array', metrics_every=1., metrics_port=0)
+    env.metrics.ring.name, env.metrics.address    #shared memory name, ('127.0.0.1', port)
+
+    #in any other process
+    ring = MetricsRing(name, create=False)
+    ring.latest()['steps_per_s']
+    #or: curl http://127.0.0.1:<port>/latest   (/history for every snapshot still in the ring)
+'''
+#-----------------------------------------------------------------------------------------------#
+
+
+class MetricsRing(object):
+    #-----------------------------------------------------------------------------------------------#
+    '''
+    Single writer, many readers ring of JSON snapshots in a named shared memory block.
+
+    Layout: a header (HEADER_DTYPE: snapshots published, slots, slot size) followed by slots of
+    (seq, size, payload). The writer zeroes a slot's seq, writes the payload, then sets seq, and
+    bumps the header last. A reader copies a slot and keeps it only if its seq was the same before
+    and after the copy, so a slot overwritten mid-read is skipped instead of returned torn.
+
+    PARMS:
+        name: str, shared memory name to attach to. None creates a block with a fresh name.
+        slots: int, snapshots kept
+        slot_bytes: int, room per JSON snapshot
+        create: bool, create the block (the writer) or attach to an existing one (readers)
+    '''
+    #-----------------------------------------------------------------------------------------------#
+    def __init__(self, name=None, slots=64, slot_bytes=2048, create=True):
+        self.owner = create
+        if create:
+            slot_dtype = self._slot_dtype(slot_bytes)
+            self.shm = shared_memory.SharedMemory(name=name, create=True,
+                                                  size=HEADER_DTYPE.itemsize + slots * slot_dtype.itemsize)
+            self.header = np.ndarray(1, dtype=HEADER_DTYPE, buffer=self.shm.buf)
+            self.header[0] = (0, slots, slot_bytes)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            resource_tracker.unregister(self.shm._name, 'shared_memory')  #the writer owns the block
+            self.header = np.ndarray(1, dtype=HEADER_DTYPE, buffer=self.shm.buf)
+        self.slots = int(self.header['slots'][0])
+        self.slot_bytes = int(self.header['slot_bytes'][0])
+        self.ring = np.ndarray(self.slots, dtype=self._slot_dtype(self.slot_bytes),
+                               buffer=self.shm.buf, offset=HEADER_DTYPE.itemsize)
+
+    @staticmethod
+    def _slot_dtype(slot_bytes):
+        return np.dtype([('seq', np.uint64), ('size', np.uint32), ('data', np.uint8, slot_bytes)])
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def seq(self):
+        return int(self.header['seq'][0])
+
+    def publish(self, snapshot):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Write one snapshot (a JSON-serializable dict) into the next slot. RETURNS: int, its seq.
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        seq = self.seq + 1
+        data = json.dumps(dict(snapshot, seq=seq), default=float).encode()
+        assert len(data) <= self.slot_bytes, 'Snapshot of {} bytes does not fit a slot'.format(len(data))
+        slot = self.ring[(seq - 1) % self.slots]
+        slot['seq'] = 0
+        slot['data'][:len(data)] = np.frombuffer(data, dtype=np.uint8)
+        slot['size'] = len(data)
+        slot['seq'] = seq
+        self.header['seq'] = seq
+        return seq
+
+    def _read(self, seq):
+        slot = self.ring[(seq - 1) % self.slots]
+        before = int(slot['seq'])
+        data = slot['data'][:int(slot['size'])].tobytes()
+        if before != seq or int(slot['seq']) != seq:
+            return None
+        return json.loads(data)
+
+    def latest(self):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        RETURNS: dict, the newest snapshot, None if nothing was published yet
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        seq = self.seq
+        return self._read(seq) if seq else None
+
+    def since(self, seq=0):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        RETURNS: list of dict, the snapshots newer than seq still in the ring, oldest first
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        last = self.seq
+        first = max(seq + 1, last - self.slots + 1, 1)
+        out = (self._read(s) for s in range(first, last + 1))
+        return [snap for snap in out if snap is not None]
+
+    def close(self):
+        self.header = self.ring = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def memory_mb():
+    #-----------------------------------------------------------------------------------------------#
+    '''
+    (current, peak) resident memory of this process in MB. Current falls back to peak off Linux.
+    '''
+    #-----------------------------------------------------------------------------------------------#
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20, peak
+    except (OSError, ValueError):
+        return peak, peak
+
+
+class MetricsPublisher(object):
+    #-----------------------------------------------------------------------------------------------#
+    '''
+    Builds snapshots of an environment and publishes them into a MetricsRing, at most once per every
+    seconds of wall time. Set up by environment(..., metrics_every=seconds), as env.metrics; the play
+    loops call env._after_round between rounds, which only reads the clock until a snapshot is due.
+
+    PARMS:
+        every: float, seconds of wall time between snapshots
+        port: int, also serve the snapshots over HTTP on 127.0.0.1:port (0 picks a free port). None
+              for no server.
+        slots: int, snapshots kept in the ring
+    '''
+    #-----------------------------------------------------------------------------------------------#
+    clock = staticmethod(time.perf_counter)
+
+    def __init__(self, every=1., port=None, slots=64):
+        self.every = every
+        self.ring = MetricsRing(slots=slots)
+        self.server = None
+        self.address = None
+        self._counted = 0  #env.words_formed already tallied into _words
+        self._words = {}
+        if port is not None:
+            self.serve(port)
+
+    def start(self, env):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Reset the rate baselines at the start of play(). Words are recounted after a reset_env.
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        now = self.clock()
+        self._started = self._last = now
+        self._next = now + self.every
+        self._ticks0 = self._ticks = env.time
+        if len(env.words_formed) < self._counted or not self._words:
+            self._counted = 0
+            self._words = {'words_' + strategy: 0 for strategy in env.strategies()}
+
+    def due(self):
+        return self.clock() >= self._next
+
+    def _success(self, env, action):
+        i = env.action_space.index(action)
+        counts = getattr(env.log, 'counts', None)
+        if counts is not None and env.log.enabled:
+            n, ok = counts[i].sum(), counts[i, 1]
+        elif env.profiler is not None:
+            n, ok = env.profiler.counts[i], env.profiler.ok[i]
+        else:
+            return None
+        return float(ok) / n if n else None
+
+    def snapshot(self, env, done=False):
+        now = self.clock()
+        n = len(env.G.nodes)
+        for word, node in env.words_formed[self._counted:]:  #only the words formed since last time
+            strategy = 'words_' + env.G.nodes[node % n]['atts'][0]
+            self._words[strategy] = self._words.get(strategy, 0) + 1
+        self._counted = len(env.words_formed)
+
+        rss, peak = memory_mb()
+        snap = {'time': env.time, 'time_max': env.time_max, 'wall': now - self._started,
+                'steps_per_s': (env.time - self._ticks) / max(now - self._last, 1e-9),
+                'steps_per_s_mean': (env.time - self._ticks0) / max(now - self._started, 1e-9),
+                'words_formed': self._counted,
+                'steal_success': self._success(env, 'steal_letter'),
+                'pass_success': self._success(env, 'pass_letter'),
+                'rss_mb': rss, 'peak_rss_mb': peak, 'done': done}
+        snap.update(self._words)
+        self._last, self._ticks = now, env.time
+        return snap
+
+    def publish(self, env, done=False):
+        seq = self.ring.publish(self.snapshot(env, done))
+        self._next = self.clock() + self.every
+        return seq
+
+    def serve(self, port=0, host='127.0.0.1'):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Serve GET /latest (newest snapshot) and GET /history (every snapshot in the ring) as JSON from
+        a daemon thread. The handler only reads the ring, so requests never touch the simulation.
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  #only when serving
+        ring = self.ring
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip('/') in ('', '/latest'):
+                    body = ring.latest()
+                elif self.path.rstrip('/') == '/history':
+                    body = ring.since(0)
+                else:
+                    self.send_error(404)
+                    return
+                data = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.address = self.server.server_address
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Stop the HTTP server and release the shared memory block. Readers see no new snapshots after.
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
@@ -0,0 +1,88 @@
+import time
+from contextlib import contextmanager
+import numpy as np
+
+
+class Profiler(object):
+    #-----------------------------------------------------------------------------------------------#
+    '''
+    Built-in instrumentation: per action type, the number of actions taken, the time spent in them and
+    how many succeeded; per named phase (set_env steps, engine round steps), calls and time spent.
+
+    Enabled with environment(..., profile=True), which sets env.profiler. Disabled, env.profiler is
+    None and every hot path pays a single `is None` check.
+
+    The object engine times every take_action call. The array engine times each action type once per
+    round (all agents acting that way at once). The partitioned engine decides actions inside its
+    worker processes, so there only counts and outcomes are recorded and the time shows up in the
+    'play' phase.
+
+    EXAMPLE:
+        env = environment(G, t_max=1000, profile=True)
+        env.set_env()
+        env.play()
+        env.profiler.summary()['actions']['steal_letter']['success_rate']
+        env.profiler.to_frame('phases')
+    '''
+    #-----------------------------------------------------------------------------------------------#
+    clock = staticmethod(time.perf_counter)
+
+    def __init__(self, action_space):
+        self.action_space = list(action_space)
+        self.reset()
+
+    def reset(self):
+        n = len(self.action_space)
+        self.counts = np.zeros(n, dtype=np.int64)
+        self.ok = np.zeros(n, dtype=np.int64)
+        self.seconds = np.zeros(n)
+        self.phases = {}  #name -> [calls, seconds]
+
+    def record(self, action, seconds, n=1, ok=1):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        Book n actions of one type that took seconds in total, ok of them successful.
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        self.counts[action] += n
+        self.ok[action] += ok
+        self.seconds[action] += seconds
+
+    def add_phase(self, name, seconds):
+        entry = self.phases.setdefault(name, [0, 0.])
+        entry[0] += 1
+        entry[1] += seconds
+
+    @contextmanager
+    def phase(self, name):
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.add_phase(name, self.clock() - start)
+
+    def summary(self):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        RETURNS:
+            dict, {'actions': {action: {count, ok, failed, success_rate, seconds, us_per_action}},
+                   'phases': {phase: {calls, seconds}}}
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        actions = {}
+        for i, name in enumerate(self.action_space):
+            n, ok, s = int(self.counts[i]), int(self.ok[i]), float(self.seconds[i])
+            actions[name] = {'count': n, 'ok': ok, 'failed': n - ok,
+                             'success_rate': ok / n if n else float('nan'), 'seconds': s,
+                             'us_per_action': 1e6 * s / n if n else float('nan')}
+        phases = {name: {'calls': calls, 'seconds': s} for name, (calls, s) in self.phases.items()}
+        return {'actions': actions, 'phases': phases}
+
+    def to_frame(self, kind='actions'):
+        #-----------------------------------------------------------------------------------------------#
+        '''
+        summary()[kind] as a pandas DataFrame, one row per action type or phase.
+        '''
+        #-----------------------------------------------------------------------------------------------#
+        import pandas as pd
+        return pd.DataFrame.from_dict(self.summary()[kind], orient='index')